@@ -1,7 +1,7 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Dict
+from typing import List, Dict, Optional
 from datetime import datetime
 import uuid
 import sys
@@ -11,7 +11,12 @@ import json
 # Add parent directory to path to import grader and database
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from grader import grade_submission
-from database import init_db, create_user, verify_user, save_submission, get_leaderboard_data
+from database_async import (
+    init_db, create_user, verify_user, save_submission, get_leaderboard_data, save_attempt, get_submission_history,
+    parse_history_cursor, decode_cursor
+)
+from password_hashing import PasswordHashingBusy
+from auth import create_access_token, enforce_rate_limit, get_current_user
 
 app = FastAPI()
 
@@ -25,7 +30,7 @@ app.add_middleware(
 @app.on_event("startup")
 async def startup_event():
     """Initializes the database on application startup."""
-    init_db()
+    await init_db()
 
 class Submission(BaseModel):
     user_id: str
@@ -48,7 +53,10 @@ async def root():
 @app.post("/signup")
 async def signup(request: SignupRequest):
     """User signup"""
-    result = create_user(request.username, request.email, request.password)
+    try:
+        result = await create_user(request.username, request.email, request.password)
+    except PasswordHashingBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["error"])
     return result
@@ -56,13 +64,20 @@ async def signup(request: SignupRequest):
 @app.post("/login")
 async def login(request: LoginRequest):
     """User login"""
-    result = verify_user(request.username, request.password)
+    try:
+        result = await verify_user(request.username, request.password)
+    except PasswordHashingBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     if not result["success"]:
         raise HTTPException(status_code=401, detail=result["error"])
+    result.update(create_access_token(result["user_id"], result["username"]))
     return result
 
 @app.post("/submit")
-async def submit_code(submission: Submission):
+async def submit_code(submission: Submission, request: Request, user: Optional[dict] = Depends(get_current_user)):
+    enforce_rate_limit(request, user)
+    if user is not None:
+        submission.user_id = user["sub"]
     # locate test_cases/<problem_id>.json
     test_case_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "test_cases", f"{submission.problem_id}.json")
     if not os.path.exists(test_case_path):
@@ -79,20 +94,55 @@ async def submit_code(submission: Submission):
     submission_entry = result["submission_entry"]
     submission_entry["timestamp"] = datetime.now() # Ensure timestamp is a datetime object
     
-    save_result = save_submission(submission_entry)
+    save_result = await save_submission(submission_entry)
     if not save_result["success"]:
         raise HTTPException(status_code=500, detail=f"Database error: {save_result['error']}")
 
+    # The history is for analytics; a failed write does not fail the submission
+    history_result = await save_attempt({
+        "submission_id": submission_entry["submission_id"],
+        "user_id": submission_entry["user_id"],
+        "problem_id": submission_entry["problem_id"],
+        "score": result["score"],
+        "total": result["total"],
+        "replay_result": result["replay_result"],
+        "code_hash": result["code_hash"],
+        "timestamp": submission_entry["timestamp"],
+        "results": result["test_results"]
+    })
+    if not history_result["success"]:
+        print(f"Warning: Failed to save submission history: {history_result['error']}")
+
     return {"grade": result, "leaderboard_entry": submission_entry}
 
 @app.get("/leaderboard")
-async def get_leaderboard():
-    """Get current leaderboard standings from the database"""
-    result = get_leaderboard_data()
+async def get_leaderboard(problem_id: Optional[str] = None, limit: int = 100, after: Optional[str] = None):
+    """Get current leaderboard standings from the database, one page at a time"""
+    if after is not None:
+        try:
+            decode_cursor(after)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    result = await get_leaderboard_data(problem_id, limit, after)
     if not result["success"]:
         raise HTTPException(status_code=500, detail=f"Database error: {result['error']}")
         
-    return {"leaderboard": result["leaderboard"]}
+    return {"leaderboard": result["leaderboard"], "next_cursor": result["next_cursor"]}
+
+@app.get("/history")
+async def get_history(user_id: Optional[str] = None, problem_id: Optional[str] = None,
+                      limit: int = 50, before: Optional[str] = None):
+    """Get graded attempts with per-test results, newest first"""
+    if before is not None:
+        try:
+            parse_history_cursor(before)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    result = await get_submission_history(user_id, problem_id, limit, before)
+    if not result["success"]:
+        raise HTTPException(status_code=500, detail=f"Database error: {result['error']}")
+
+    return {"attempts": result["attempts"], "next_cursor": result["next_cursor"]}
 
 @app.get("/problems")
 def list_problems():
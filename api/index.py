@@ -2,7 +2,7 @@ from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from datetime import datetime
-from database import init_db, create_user, verify_user
+from database import init_db, create_user, verify_user, get_pool_stats
 import os
 
 # Initialize database on startup
@@ -54,6 +54,11 @@ async def login(request: LoginRequest):
         raise HTTPException(status_code=401, detail=result["error"])
     return result
 
+@app.get("/db/pool")
+def db_pool_stats():
+    """Database connection pool metrics"""
+    return get_pool_stats()
+
 @app.get("/problems")
 def list_problems():
     problems = [
@@ -105,7 +110,6 @@ async def submit_code(submission: Submission):
 async def run_code(request: dict):
     """Run code without grading - just execute with first public test"""
     import subprocess
-    import tempfile
     import os
     import time
     
@@ -122,34 +126,17 @@ async def run_code(request: dict):
         else:
             test_input = ""
         
-        # Create temporary file
-        with tempfile.NamedTemporaryFile(mode='w+', suffix='.py', delete=False) as tmp:
-            tmp_file = tmp.name
-            tmp.write(code + "\n")
-            tmp.write(f"""
-if __name__ == "__main__":
-    import sys
-    from io import StringIO
-    
-    input_data = '''{test_input}'''
-    sys.stdin = StringIO(input_data)
-    
-    solve()
-""")
-            tmp.flush()
-        
+        # The code is passed on the command line, so nothing touches the disk
         start_time = time.time()
         result = subprocess.run(
-            ["python", tmp_file],
+            ["python", "-c", code + "\n\nsolve()\n"],
+            input=test_input,
             capture_output=True,
             text=True,
             timeout=5
         )
         execution_time = round(time.time() - start_time, 3)
         
-        # Clean up
-        os.unlink(tmp_file)
-        
         if result.returncode != 0:
             return {
                 "success": False,
@@ -0,0 +1,139 @@
+"""Signed session tokens and per-user rate limiting.
+
+``/api/login`` verifies the password once and issues an HS256 JWT. Later
+requests send it as ``Authorization: Bearer <token>``; it is checked
+statelessly against a signing key built once at import, and recently seen
+tokens are kept in a small cache, so neither argon2 nor the database is
+touched again until the token expires.
+"""
+import os
+import secrets
+import threading
+import time
+from functools import lru_cache
+from typing import Optional
+
+from fastapi import Header, HTTPException, Request
+from jose import JWTError, jwk, jwt
+
+JWT_ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 60 * 24))
+# Reject submit/run requests that carry no token.
+REQUIRE_AUTH = os.getenv("REQUIRE_AUTH", "0") == "1"
+
+# Token bucket per user for submit/run: refills at RATE_LIMIT_PER_MINUTE,
+# holds at most RATE_LIMIT_BURST requests. 0 (the default) disables rate
+# limiting; anonymous callers are keyed by client address, which behind a
+# proxy is the proxy's, so they would all share one bucket.
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", 0))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", 10))
+
+JWT_SECRET = os.getenv("JWT_SECRET")
+if not JWT_SECRET and REQUIRE_AUTH:
+    # A per-process secret would reject tokens issued by another uvicorn worker.
+    raise RuntimeError("JWT_SECRET must be set when REQUIRE_AUTH=1")
+if not JWT_SECRET:
+    # Tokens will not survive a restart or work across uvicorn workers; such
+    # requests are treated as anonymous.
+    JWT_SECRET = secrets.token_urlsafe(32)
+    print("⚠ Warning: JWT_SECRET not set - using a random per-process secret")
+
+_signing_key = jwk.construct(JWT_SECRET, JWT_ALGORITHM)
+
+
+def create_access_token(user_id, username: str) -> dict:
+    """Issue a token for a user who has just logged in"""
+    now = int(time.time())
+    expires_in = ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    claims = {"sub": username, "uid": user_id, "iat": now, "exp": now + expires_in}
+    return {
+        "access_token": jwt.encode(claims, _signing_key, algorithm=JWT_ALGORITHM),
+        "token_type": "bearer",
+        "expires_in": expires_in,
+    }
+
+
+@lru_cache(maxsize=4096)
+def _decode(token: str) -> dict:
+    # Expiry is checked by the caller so cached claims cannot outlive it.
+    return jwt.decode(token, _signing_key, algorithms=[JWT_ALGORITHM], options={"verify_exp": False})
+
+
+def decode_access_token(token: str) -> dict:
+    """Return the claims of a valid token; raise ValueError otherwise"""
+    try:
+        claims = _decode(token)
+    except JWTError as e:
+        raise ValueError(f"Invalid token: {e}")
+    if claims.get("exp", 0) <= time.time():
+        raise ValueError("Token expired")
+    return claims
+
+
+def get_current_user(authorization: Optional[str] = Header(None)):
+    """FastAPI dependency: the token's claims, or None for anonymous requests.
+
+    Unless REQUIRE_AUTH is set, a missing, malformed or expired token makes the
+    request anonymous rather than failing it.
+    """
+    if not authorization:
+        if REQUIRE_AUTH:
+            raise HTTPException(status_code=401, detail="Not authenticated",
+                                headers={"WWW-Authenticate": "Bearer"})
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        if not REQUIRE_AUTH:
+            return None
+        raise HTTPException(status_code=401, detail="Invalid authorization header",
+                            headers={"WWW-Authenticate": "Bearer"})
+    try:
+        return decode_access_token(token.strip())
+    except ValueError as e:
+        if not REQUIRE_AUTH:
+            return None
+        raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+
+
+class RateLimiter:
+    """In-memory token buckets keyed by user."""
+
+    def __init__(self, per_minute: float, burst: int):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self._buckets = {}  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str) -> float:
+        """Take a token for ``key``. Returns 0, or the seconds until one is free."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            if len(self._buckets) > 10000:
+                self._prune(now)
+            tokens, updated_at = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return (1 - tokens) / self.rate
+            self._buckets[key] = (tokens - 1, now)
+            return 0.0
+
+    def _prune(self, now):
+        """Forget buckets that have refilled completely."""
+        full_after = self.burst / self.rate
+        self._buckets = {key: bucket for key, bucket in self._buckets.items()
+                         if now - bucket[1] < full_after}
+
+
+rate_limiter = RateLimiter(RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST)
+
+
+def enforce_rate_limit(request: Request, user: Optional[dict]):
+    """Raise 429 once the caller (user, or client address if anonymous) is over the limit"""
+    key = f"user:{user['sub']}" if user else f"ip:{request.client.host if request.client else 'unknown'}"
+    retry_after = rate_limiter.acquire(key)
+    if retry_after:
+        raise HTTPException(status_code=429, detail="Too many requests, slow down",
+                            headers={"Retry-After": str(int(retry_after) + 1)})
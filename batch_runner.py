@@ -0,0 +1,184 @@
+"""Run every test case of a submission inside a single child process.
+
+The parent (``run_batch``) starts ``python batch_runner.py`` and sends it one
+JSON document on stdin: the submission code, the list of test inputs, the
+wall-clock, CPU time and memory limits of each case and the process limit
+(applied to the whole child with ``setrlimit``). The child compiles the code once, then for each input
+executes it in a fresh ``__main__`` namespace and calls ``solve()`` with
+``sys.stdin``/``sys.stdout`` swapped for that case. One JSON record per case is
+streamed back on stdout as soon as the case finishes, with the CPU time and
+peak memory the case used.
+
+If the child dies or hangs part way through, the records already received are
+kept, the case in progress is reported as a crash or timeout, and a new child
+is started for the remaining cases.
+"""
+import json
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import CancelledError
+
+from sandbox import (
+    CaseResult, CpuTimeExceeded, WallTimeExceeded, install_case_timers, make_usage, run_in_process, set_limits,
+)
+
+RUNNER_ARGS = [sys.executable, os.path.abspath(__file__)]
+
+# Extra wall-clock time the parent allows per case on top of the limit the
+# child enforces itself, before it kills the child.
+GRACE_SECONDS = 1.0
+
+# How often the parent checks whether the run has been cancelled.
+POLL_INTERVAL = 0.05
+
+
+def main():
+    job = json.loads(sys.stdin.read())
+    # Keep the real stdout for result records and point fd 1 at /dev/null so
+    # output written below the sys.stdout level cannot corrupt the stream.
+    records = os.fdopen(os.dup(1), "w")
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.close(devnull)
+    install_case_timers()
+    # Per-case CPU time and memory are capped by the profiling timer and the
+    # soft RLIMIT_AS; the hard limits are a backstop for the whole child that
+    # the submission cannot raise.
+    memory_limits = [memory_mb for _, _, memory_mb in job["limits"]]
+    set_limits(
+        sum(cpu_limit for _, cpu_limit, _ in job["limits"]) + 1,
+        max(memory_limits) if all(memory_limits) else None,
+        job["max_processes"],
+    )
+
+    try:
+        code_obj = compile(job["code"] + "\n\nsolve()\n", "<submission>", "exec")
+    except SyntaxError:
+        message = traceback.format_exc(limit=0)
+        for index in range(len(job["inputs"])):
+            records.write(json.dumps({
+                "index": index, "returncode": 1, "stdout": "", "stderr": message,
+                "timed_out": False, "cpu_exceeded": False, "memory_exceeded": False,
+                "elapsed": 0.0, "cpu": 0.0, "memory_kb": None,
+            }) + "\n")
+        records.flush()
+        return
+
+    for index, (stdin_data, limits) in enumerate(zip(job["inputs"], job["limits"])):
+        record = run_in_process(code_obj, stdin_data, *limits)
+        record["index"] = index
+        records.write(json.dumps(record) + "\n")
+        records.flush()
+
+
+def _read_lines(stream, lines):
+    for line in stream:
+        lines.put(line)
+    lines.put(None)
+
+
+def _start(code: str, inputs: list, limits: list, max_processes):
+    proc = subprocess.Popen(
+        RUNNER_ARGS,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    lines = queue.Queue()
+    threading.Thread(target=_read_lines, args=(proc.stdout, lines), daemon=True).start()
+    stderr_chunks = []
+    stderr_reader = threading.Thread(target=lambda: stderr_chunks.append(proc.stderr.read()), daemon=True)
+    stderr_reader.start()
+    try:
+        proc.stdin.write(json.dumps({
+            "code": code, "inputs": inputs, "limits": limits, "max_processes": max_processes,
+        }))
+        proc.stdin.close()
+    except BrokenPipeError:
+        pass
+    return proc, lines, stderr_reader, stderr_chunks
+
+
+def _next_line(lines, timeout: float, cancel):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return lines.get(timeout=min(POLL_INTERVAL, max(0, deadline - time.monotonic())))
+        except queue.Empty:
+            if cancel is not None and cancel.is_set():
+                raise CancelledError()
+            if time.monotonic() >= deadline:
+                raise
+
+
+def run_batch(code: str, inputs: list, limits: list, cancel=None, max_processes: int = None):
+    """Yield one ``(outcome, usage)`` pair per input, in order, as soon as each case finishes.
+
+    ``limits`` holds one ``(timeout, cpu_limit, memory_mb)`` tuple per input:
+    seconds of wall time, seconds of CPU time and the address-space limit.
+    Each outcome is a ``sandbox.CaseResult`` or, for a case that used more
+    than ``cpu_limit`` seconds of CPU or had not finished after ``timeout``
+    seconds, a ``sandbox.CpuTimeExceeded`` or ``sandbox.WallTimeExceeded``
+    instance; ``usage`` is the case's ``sandbox.make_usage`` record. Setting
+    the optional ``cancel`` event kills the child and raises
+    ``concurrent.futures.CancelledError``.
+    """
+    limits = [list(case_limits) for case_limits in limits]
+    next_index = 0
+    while next_index < len(inputs):
+        proc, lines, stderr_reader, stderr_chunks = _start(
+            code, inputs[next_index:], limits[next_index:], max_processes
+        )
+        last_record = time.perf_counter()
+        try:
+            while next_index < len(inputs):
+                timeout, cpu_limit, _ = limits[next_index]
+                try:
+                    line = _next_line(lines, timeout + GRACE_SECONDS, cancel)
+                except queue.Empty:
+                    # The case is stuck where the in-process timer cannot reach it.
+                    proc.kill()
+                    usage = make_usage(time.perf_counter() - last_record)
+                    yield WallTimeExceeded(RUNNER_ARGS, timeout, usage), usage
+                    next_index += 1
+                    break
+                if line is None:
+                    # The child died while running this case.
+                    returncode = proc.wait()
+                    stderr_reader.join(timeout=1)
+                    usage = make_usage(time.perf_counter() - last_record)
+                    if returncode == -signal.SIGXCPU:
+                        # Past the child's RLIMIT_CPU: the profiling timer was switched off.
+                        yield CpuTimeExceeded(RUNNER_ARGS, cpu_limit, usage), usage
+                    else:
+                        stderr = "".join(stderr_chunks).strip() or f"Process exited with code {returncode}"
+                        yield CaseResult(RUNNER_ARGS, returncode or 1, "", stderr, usage), usage
+                    next_index += 1
+                    break
+                last_record = time.perf_counter()
+                record = json.loads(line)
+                usage = make_usage(record["elapsed"], record["cpu"], record["memory_kb"], record["memory_exceeded"])
+                if record["cpu_exceeded"]:
+                    yield CpuTimeExceeded(RUNNER_ARGS, cpu_limit, usage), usage
+                elif record["timed_out"]:
+                    yield WallTimeExceeded(RUNNER_ARGS, timeout, usage), usage
+                else:
+                    yield CaseResult(
+                        RUNNER_ARGS, record["returncode"], record["stdout"], record["stderr"], usage
+                    ), usage
+                next_index += 1
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
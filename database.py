@@ -1,206 +1,313 @@
 import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
 from psycopg2.extras import RealDictCursor
 import os
-from passlib.context import CryptContext
-from datetime import datetime
-import json
-
-# Password hashing
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+import threading
+import time
+from contextlib import contextmanager
+from password_hashing import hash_password, verify_password, PasswordHashingBusy
 
 # Database connection string will be provided by Railway environment variables
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# Connection pool settings
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 5))  # seconds to wait for a free connection
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", 300))  # close idle connections above the minimum after this
+DB_POOL_HEALTH_CHECK_AFTER = float(os.getenv("DB_POOL_HEALTH_CHECK_AFTER", 30))  # ping connections idle this long
+
 def get_db_connection():
     """Get database connection"""
     conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
     return conn
 
+class PoolTimeoutError(Exception):
+    """No pooled connection became free within the checkout timeout."""
+
+class ConnectionPool:
+    """Thread-safe pool of database connections.
+
+    Connections idle longer than ``health_check_after`` are pinged before
+    being handed out, and those idle longer than ``max_idle`` are closed as
+    long as more than ``minconn`` remain open.
+    """
+
+    def __init__(self, connect, minconn, maxconn, timeout, max_idle, health_check_after):
+        self._connect = connect
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.health_check_after = health_check_after
+        self._idle = []  # (connection, returned_at), most recently used last
+        self._size = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+        self._stats = {"checkouts": 0, "timeouts": 0, "health_check_failures": 0,
+                       "connections_opened": 0, "connections_closed": 0,
+                       "total_wait_time": 0.0, "max_wait_time": 0.0}
+        for _ in range(minconn):
+            self._idle.append((self._open(), time.monotonic()))
+            self._size += 1
+
+    def _open(self):
+        conn = self._connect()
+        self._stats["connections_opened"] += 1
+        return conn
+
+    def _close(self, conn):
+        self._stats["connections_closed"] += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _healthy(self, conn, idle_for):
+        if conn.closed:
+            return False
+        if idle_for < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            with self._cond:
+                self._stats["health_check_failures"] += 1
+            return False
+
+    def _reap_idle(self, now):
+        """Close connections idle for longer than max_idle, keeping minconn."""
+        while self._size > self.minconn and self._idle and now - self._idle[0][1] > self.max_idle:
+            conn, _ = self._idle.pop(0)
+            self._size -= 1
+            self._close(conn)
+
+    def _reserve(self, deadline):
+        """Take an idle ``(connection, returned_at)``, or claim a slot for a new
+        connection (returns None). Called with ``self._cond`` held."""
+        while True:
+            now = time.monotonic()
+            self._reap_idle(now)
+            if self._idle:
+                return self._idle.pop()
+            if self._size < self.maxconn:
+                self._size += 1
+                return None
+            remaining = deadline - now
+            if remaining <= 0:
+                self._stats["timeouts"] += 1
+                raise PoolTimeoutError(f"No database connection available within {self.timeout} seconds")
+            self._waiting += 1
+            try:
+                self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+    def _release_slot(self, conn=None):
+        """Give back a reserved slot whose connection failed, closing ``conn`` if given."""
+        with self._cond:
+            self._size -= 1
+            if conn is not None:
+                self._close(conn)
+            self._cond.notify()
+
+    def getconn(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        # Only the reservation happens under the lock; connecting and health
+        # checks can take a network round trip.
+        while True:
+            with self._cond:
+                reserved = self._reserve(deadline)
+            if reserved is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    self._release_slot()
+                    raise
+                with self._cond:
+                    self._stats["connections_opened"] += 1
+                break
+            conn, returned_at = reserved
+            if self._healthy(conn, time.monotonic() - returned_at):
+                break
+            self._release_slot(conn)
+        with self._cond:
+            waited = time.monotonic() - started
+            self._stats["checkouts"] += 1
+            self._stats["total_wait_time"] += waited
+            self._stats["max_wait_time"] = max(self._stats["max_wait_time"], waited)
+            return conn
+
+    def putconn(self, conn):
+        broken = conn.closed
+        if not broken and conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+        with self._cond:
+            if broken:
+                self._size -= 1
+                self._close(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            for conn, _ in self._idle:
+                self._close(conn)
+            self._size -= len(self._idle)
+            self._idle = []
+
+    def stats(self):
+        with self._cond:
+            checkouts = self._stats["checkouts"]
+            return {
+                "size": self._size,
+                "in_use": self._size - len(self._idle),
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "min_size": self.minconn,
+                "max_size": self.maxconn,
+                "saturated": self._size >= self.maxconn and not self._idle,
+                "checkouts": checkouts,
+                "timeouts": self._stats["timeouts"],
+                "health_check_failures": self._stats["health_check_failures"],
+                "connections_opened": self._stats["connections_opened"],
+                "connections_closed": self._stats["connections_closed"],
+                "avg_wait_time": round(self._stats["total_wait_time"] / checkouts, 6) if checkouts else 0.0,
+                "max_wait_time": round(self._stats["max_wait_time"], 6),
+            }
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Get the process-wide connection pool, creating it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(
+                get_db_connection, DB_POOL_MIN, DB_POOL_MAX,
+                DB_POOL_TIMEOUT, DB_POOL_MAX_IDLE, DB_POOL_HEALTH_CHECK_AFTER
+            )
+        return _pool
+
+def get_pool_stats():
+    """Get connection pool metrics"""
+    return get_pool().stats()
+
+@contextmanager
+def db_connection():
+    """Borrow a pooled connection; it is rolled back if left mid-transaction"""
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
 def init_db():
     """Initialize database tables"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    # Create users table
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id SERIAL PRIMARY KEY,
-            username VARCHAR(50) UNIQUE NOT NULL,
-            email VARCHAR(100) UNIQUE NOT NULL,
-            hashed_password VARCHAR(255) NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
+    with db_connection() as conn:
+        cur = conn.cursor()
     
-    # Create submissions table
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS submissions (
-            id UUID PRIMARY KEY,
-            user_id VARCHAR(50) NOT NULL,
-            problem_id VARCHAR(100) NOT NULL,
-            score INTEGER NOT NULL,
-            replay_result VARCHAR(50) NOT NULL,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            error_details TEXT,
-            UNIQUE (user_id, problem_id)
-        )
-    """)
+        # Create users table
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id SERIAL PRIMARY KEY,
+                username VARCHAR(50) UNIQUE NOT NULL,
+                email VARCHAR(100) UNIQUE NOT NULL,
+                hashed_password VARCHAR(255) NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
     
-    conn.commit()
-    cur.close()
-    conn.close()
+        # Create submissions table
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS submissions (
+                id UUID PRIMARY KEY,
+                user_id VARCHAR(50) NOT NULL,
+                problem_id VARCHAR(100) NOT NULL,
+                score INTEGER NOT NULL,
+                replay_result VARCHAR(50) NOT NULL,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                error_details TEXT,
+                UNIQUE (user_id, problem_id)
+            )
+        """)
+        conn.commit()
+        cur.close()
 
 def create_user(username: str, email: str, password: str):
     """Create new user"""
-    conn = get_db_connection()
-    cur = conn.cursor()
+    with db_connection() as conn:
+        cur = conn.cursor()
     
-    try:
-        password_bytes = password.encode('utf-8')
-        if len(password_bytes) > 72:
-            truncated_bytes = password_bytes[:72]
-            while truncated_bytes:
-                try:
-                    password = truncated_bytes.decode('utf-8')
-                    break
-                except UnicodeDecodeError:
-                    truncated_bytes = truncated_bytes[:-1]
-        
-        hashed_password = pwd_context.hash(password)
+        try:
+            hashed_password = hash_password(password)
         
-        cur.execute(
-            "INSERT INTO users (username, email, hashed_password) VALUES (%s, %s, %s) RETURNING id",
-            (username, email, hashed_password)
-        )
-        user_id = cur.fetchone()['id']
-        conn.commit()
-        return {"success": True, "user_id": user_id, "username": username}
+            cur.execute(
+                "INSERT INTO users (username, email, hashed_password) VALUES (%s, %s, %s) RETURNING id",
+                (username, email, hashed_password)
+            )
+            user_id = cur.fetchone()['id']
+            conn.commit()
+            return {"success": True, "user_id": user_id, "username": username}
         
-    except psycopg2.IntegrityError as e:
-        conn.rollback()
-        error_msg = str(e)
-        if "username" in error_msg:
-            return {"success": False, "error": "Username already exists"}
-        elif "email" in error_msg:
-            return {"success": False, "error": "Email already exists"}
-        else:
-            return {"success": False, "error": "Username or email already exists"}
+        except psycopg2.IntegrityError as e:
+            conn.rollback()
+            error_msg = str(e)
+            if "username" in error_msg:
+                return {"success": False, "error": "Username already exists"}
+            elif "email" in error_msg:
+                return {"success": False, "error": "Email already exists"}
+            else:
+                return {"success": False, "error": "Username or email already exists"}
             
-    except Exception as e:
-        conn.rollback()
-        return {"success": False, "error": f"Error: {str(e)}"}
+        except PasswordHashingBusy:
+            conn.rollback()
+            raise
+            
+        except Exception as e:
+            conn.rollback()
+            return {"success": False, "error": f"Error: {str(e)}"}
         
-    finally:
-        cur.close()
-        conn.close()
+        finally:
+            cur.close()
 
 def verify_user(username: str, password: str):
     """Verify user credentials"""
-    conn = get_db_connection()
-    cur = conn.cursor()
+    with db_connection() as conn:
+        cur = conn.cursor()
     
-    try:
-        cur.execute("SELECT * FROM users WHERE username = %s", (username,))
-        user = cur.fetchone()
+        try:
+            cur.execute("SELECT * FROM users WHERE username = %s", (username,))
+            user = cur.fetchone()
         
-        if not user:
-            return {"success": False, "error": "Invalid credentials"}
-        
-        password_bytes = password.encode('utf-8')
-        if len(password_bytes) > 72:
-            truncated_bytes = password_bytes[:72]
-            while truncated_bytes:
-                try:
-                    password = truncated_bytes.decode('utf-8')
-                    break
-                except UnicodeDecodeError:
-                    truncated_bytes = truncated_bytes[:-1]
+            if not user:
+                return {"success": False, "error": "Invalid credentials"}
         
-        if pwd_context.verify(password, user['hashed_password']):
-            return {
-                "success": True, 
-                "user_id": user['id'], 
-                "username": user['username'], 
-                "email": user['email']
-            }
-        else:
-            return {"success": False, "error": "Invalid credentials"}
+            if verify_password(password, user['hashed_password']):
+                return {
+                    "success": True, 
+                    "user_id": user['id'], 
+                    "username": user['username'], 
+                    "email": user['email']
+                }
+            else:
+                return {"success": False, "error": "Invalid credentials"}
             
-    except Exception as e:
-        return {"success": False, "error": f"Database error: {str(e)}"}
-        
-    finally:
-        cur.close()
-        conn.close()
-
-def save_submission(submission_entry: dict):
-    """Save a submission to the database"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    try:
-        cur.execute(
-            """
-            INSERT INTO submissions (id, user_id, problem_id, score, replay_result, timestamp, error_details)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (user_id, problem_id) DO UPDATE SET
-                score = EXCLUDED.score,
-                replay_result = EXCLUDED.replay_result,
-                timestamp = EXCLUDED.timestamp,
-                error_details = EXCLUDED.error_details
-            WHERE EXCLUDED.score > submissions.score OR (EXCLUDED.score = submissions.score AND EXCLUDED.timestamp < submissions.timestamp)
-            """,
-            (
-                submission_entry["submission_id"],
-                submission_entry["user_id"],
-                submission_entry["problem_id"],
-                submission_entry["score"],
-                submission_entry["replay_result"],
-                submission_entry["timestamp"],
-                json.dumps(submission_entry.get("error_details", []))
-            )
-        )
-        conn.commit()
-        return {"success": True}
-    except Exception as e:
-        conn.rollback()
-        return {"success": False, "error": str(e)}
-    finally:
-        cur.close()
-        conn.close()
-
-def get_leaderboard_data():
-    """Retrieve all submissions and format for leaderboard"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    try:
-        # This query gets the latest best score per user for each problem
-        cur.execute("""
-            SELECT
-                id, user_id, problem_id, score, replay_result, timestamp
-            FROM (
-                SELECT
-                    id, user_id, problem_id, score, replay_result, timestamp,
-                    ROW_NUMBER() OVER (PARTITION BY user_id, problem_id ORDER BY score DESC, timestamp ASC) as rn
-                FROM submissions
-            ) as t
-            WHERE t.rn = 1
-            ORDER BY score DESC, timestamp ASC
-        """)
-        submissions_by_problem = cur.fetchall()
+        except PasswordHashingBusy:
+            raise
+            
+        except Exception as e:
+            return {"success": False, "error": f"Database error: {str(e)}"}
         
-        # Now, aggregate to get the single best score per user across all problems
-        leaderboard = []
-        seen = set()
-        for entry in submissions_by_problem:
-            if entry['user_id'] not in seen:
-                leaderboard.append(dict(entry))
-                seen.add(entry['user_id'])
-                
-        return {"success": True, "leaderboard": leaderboard}
-    except Exception as e:
-        return {"success": False, "error": str(e)}
-    finally:
-        cur.close()
-        conn.close()
\ No newline at end of file
+        finally:
+            cur.close()
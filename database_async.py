@@ -0,0 +1,529 @@
+"""Async counterpart of ``database.py`` for the FastAPI handlers.
+
+Exposes the same functions as coroutines on top of an asyncpg connection
+pool, so a slow query only suspends the request that issued it instead of
+blocking the event loop. Password hashing runs on the bounded pool of
+``password_hashing``.
+"""
+import asyncpg
+import base64
+import asyncio
+import os
+import time
+from datetime import datetime
+import json
+import uuid
+from password_hashing import hash_password_async, verify_password_async, PasswordHashingBusy
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+
+# Leaderboard page sizes
+LEADERBOARD_PAGE_SIZE = 100
+LEADERBOARD_MAX_PAGE_SIZE = 500
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+# Submissions arriving within this window are written in one transaction
+SUBMISSION_BATCH_SIZE = int(os.getenv("SUBMISSION_BATCH_SIZE", 100))
+SUBMISSION_FLUSH_INTERVAL = float(os.getenv("SUBMISSION_FLUSH_INTERVAL_MS", 10)) / 1000
+
+# Same pool settings as the synchronous module.
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", 1))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 5))
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", 300))
+
+_pool = None
+_pool_lock = asyncio.Lock()
+_stats = {"checkouts": 0, "timeouts": 0, "total_wait_time": 0.0, "max_wait_time": 0.0}
+
+async def get_pool():
+    """Get the connection pool, creating it on first use"""
+    global _pool
+    async with _pool_lock:
+        if _pool is None:
+            _pool = await asyncpg.create_pool(
+                DATABASE_URL,
+                min_size=DB_POOL_MIN,
+                max_size=DB_POOL_MAX,
+                max_inactive_connection_lifetime=DB_POOL_MAX_IDLE,
+            )
+        return _pool
+
+async def close_pool():
+    """Close the connection pool"""
+    global _pool
+    async with _pool_lock:
+        if _pool is not None:
+            await _pool.close()
+            _pool = None
+
+class db_connection:
+    """Borrow a pooled connection: ``async with db_connection() as conn:``"""
+
+    async def __aenter__(self):
+        self._pool = await get_pool()
+        started = time.monotonic()
+        try:
+            self._conn = await self._pool.acquire(timeout=DB_POOL_TIMEOUT)
+        except asyncio.TimeoutError:
+            _stats["timeouts"] += 1
+            raise
+        waited = time.monotonic() - started
+        _stats["checkouts"] += 1
+        _stats["total_wait_time"] += waited
+        _stats["max_wait_time"] = max(_stats["max_wait_time"], waited)
+        return self._conn
+
+    async def __aexit__(self, *exc_info):
+        await self._pool.release(self._conn)
+
+def get_pool_stats():
+    """Get connection pool metrics"""
+    checkouts = _stats["checkouts"]
+    stats = {
+        "size": 0, "in_use": 0, "idle": 0,
+        "min_size": DB_POOL_MIN, "max_size": DB_POOL_MAX, "saturated": False,
+        "checkouts": checkouts,
+        "timeouts": _stats["timeouts"],
+        "avg_wait_time": round(_stats["total_wait_time"] / checkouts, 6) if checkouts else 0.0,
+        "max_wait_time": round(_stats["max_wait_time"], 6),
+    }
+    if _pool is not None:
+        size, idle = _pool.get_size(), _pool.get_idle_size()
+        stats.update(size=size, in_use=size - idle, idle=idle, saturated=size >= DB_POOL_MAX and idle == 0)
+    return stats
+
+async def init_db():
+    """Initialize database tables"""
+    async with db_connection() as conn:
+        # Create users table
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id SERIAL PRIMARY KEY,
+                username VARCHAR(50) UNIQUE NOT NULL,
+                email VARCHAR(100) UNIQUE NOT NULL,
+                hashed_password VARCHAR(255) NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        # Create submissions table
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS submissions (
+                id UUID PRIMARY KEY,
+                user_id VARCHAR(50) NOT NULL,
+                problem_id VARCHAR(100) NOT NULL,
+                score INTEGER NOT NULL,
+                replay_result VARCHAR(50) NOT NULL,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                error_details TEXT,
+                UNIQUE (user_id, problem_id)
+            )
+        """)
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS submissions_problem_rank
+            ON submissions (problem_id, (-score), timestamp, user_id)
+        """)
+
+        # Best submission of each user across all problems, kept up to date
+        # by save_submission so the overall leaderboard is a plain index scan
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS best_scores (
+                user_id VARCHAR(50) PRIMARY KEY,
+                submission_id UUID NOT NULL,
+                problem_id VARCHAR(100) NOT NULL,
+                score INTEGER NOT NULL,
+                replay_result VARCHAR(50) NOT NULL,
+                timestamp TIMESTAMP NOT NULL
+            )
+        """)
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS best_scores_rank
+            ON best_scores ((-score), timestamp, user_id)
+        """)
+        # Backfill from submissions saved before best_scores existed
+        await conn.execute("""
+            INSERT INTO best_scores (user_id, submission_id, problem_id, score, replay_result, timestamp)
+            SELECT DISTINCT ON (user_id) user_id, id, problem_id, score, replay_result, timestamp
+            FROM submissions
+            WHERE NOT EXISTS (SELECT 1 FROM best_scores)
+            ORDER BY user_id, score DESC, timestamp ASC
+            ON CONFLICT (user_id) DO NOTHING
+        """)
+
+        # Every graded attempt, append-only, partitioned by month
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS submission_attempts (
+                id UUID NOT NULL,
+                user_id VARCHAR(50) NOT NULL,
+                problem_id VARCHAR(100) NOT NULL,
+                score INTEGER NOT NULL,
+                total INTEGER NOT NULL,
+                replay_result VARCHAR(50) NOT NULL,
+                code_hash CHAR(64) NOT NULL,
+                results JSONB NOT NULL,
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (id, created_at)
+            ) PARTITION BY RANGE (created_at)
+        """)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS submission_attempts_default
+            PARTITION OF submission_attempts DEFAULT
+        """)
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS submission_attempts_user
+            ON submission_attempts (user_id, created_at DESC, id DESC)
+        """)
+        await conn.execute("""
+            CREATE INDEX IF NOT EXISTS submission_attempts_problem
+            ON submission_attempts (problem_id, created_at DESC, id DESC)
+        """)
+        now = datetime.utcnow()
+        for month in (_month_start(now), _next_month(now)):
+            await _create_attempt_partition(conn, month)
+
+def _month_start(moment: datetime):
+    return datetime(moment.year, moment.month, 1)
+
+def _next_month(moment: datetime):
+    return datetime(moment.year + moment.month // 12, moment.month % 12 + 1, 1)
+
+_attempt_partitions = set()
+
+async def _create_attempt_partition(conn, month: datetime):
+    """Create the submission_attempts partition for ``month`` if missing
+
+    Creating it fails if the default partition already holds rows of that
+    month; those rows then simply stay in the default partition.
+    """
+    if month in _attempt_partitions:
+        return
+    try:
+        # DDL takes no bind parameters; both bounds are formatted dates.
+        await conn.execute(
+            f"CREATE TABLE IF NOT EXISTS submission_attempts_{month:%Y_%m} "
+            f"PARTITION OF submission_attempts FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_next_month(month):%Y-%m-%d}')"
+        )
+    except asyncpg.PostgresError as e:
+        print(f"Warning: could not create submission_attempts partition for {month:%Y-%m}: {e}")
+    _attempt_partitions.add(month)
+
+async def create_user(username: str, email: str, password: str):
+    """Create new user"""
+    try:
+        hashed_password = await hash_password_async(password)
+        async with db_connection() as conn:
+            user_id = await conn.fetchval(
+                "INSERT INTO users (username, email, hashed_password) VALUES ($1, $2, $3) RETURNING id",
+                username, email, hashed_password
+            )
+        return {"success": True, "user_id": user_id, "username": username}
+    except asyncpg.IntegrityConstraintViolationError as e:
+        error_msg = str(e)
+        if "username" in error_msg:
+            return {"success": False, "error": "Username already exists"}
+        elif "email" in error_msg:
+            return {"success": False, "error": "Email already exists"}
+        else:
+            return {"success": False, "error": "Username or email already exists"}
+    except PasswordHashingBusy:
+        raise
+    except Exception as e:
+        return {"success": False, "error": f"Error: {str(e)}"}
+
+async def verify_user(username: str, password: str):
+    """Verify user credentials"""
+    try:
+        async with db_connection() as conn:
+            user = await conn.fetchrow(
+                "SELECT id, username, email, hashed_password FROM users WHERE username = $1",
+                username
+            )
+
+        if not user:
+            return {"success": False, "error": "Invalid credentials"}
+
+        if await verify_password_async(password, user['hashed_password']):
+            return {
+                "success": True,
+                "user_id": user['id'],
+                "username": user['username'],
+                "email": user['email']
+            }
+        else:
+            return {"success": False, "error": "Invalid credentials"}
+
+    except PasswordHashingBusy:
+        raise
+    except Exception as e:
+        return {"success": False, "error": f"Database error: {str(e)}"}
+
+SUBMISSION_UPSERT = """
+    INSERT INTO submissions (id, user_id, problem_id, score, replay_result, timestamp, error_details)
+    SELECT * FROM unnest($1::uuid[], $2::varchar[], $3::varchar[], $4::integer[], $5::varchar[], $6::timestamp[], $7::text[])
+    ON CONFLICT (user_id, problem_id) DO UPDATE SET
+        score = EXCLUDED.score,
+        replay_result = EXCLUDED.replay_result,
+        timestamp = EXCLUDED.timestamp,
+        error_details = EXCLUDED.error_details
+    WHERE EXCLUDED.score > submissions.score OR (EXCLUDED.score = submissions.score AND EXCLUDED.timestamp < submissions.timestamp)
+"""
+
+# Keep a user's best submission: higher score, or the same score reached earlier
+BEST_SCORE_UPSERT = """
+    INSERT INTO best_scores (user_id, submission_id, problem_id, score, replay_result, timestamp)
+    SELECT * FROM unnest($1::varchar[], $2::uuid[], $3::varchar[], $4::integer[], $5::varchar[], $6::timestamp[])
+    ON CONFLICT (user_id) DO UPDATE SET
+        submission_id = EXCLUDED.submission_id,
+        problem_id = EXCLUDED.problem_id,
+        score = EXCLUDED.score,
+        replay_result = EXCLUDED.replay_result,
+        timestamp = EXCLUDED.timestamp
+    WHERE EXCLUDED.score > best_scores.score OR (EXCLUDED.score = best_scores.score AND EXCLUDED.timestamp < best_scores.timestamp)
+"""
+
+def _is_better(entry: dict, other: dict):
+    return entry["score"] > other["score"] or (entry["score"] == other["score"] and entry["timestamp"] < other["timestamp"])
+
+def _best_entries(entries, key):
+    """Keep the best entry per ``key(entry)``, sorted by key
+
+    A multi-row upsert may not touch the same row twice, and a stable row
+    order keeps concurrent batches from deadlocking each other.
+    """
+    best = {}
+    for entry in entries:
+        k = key(entry)
+        if k not in best or _is_better(entry, best[k]):
+            best[k] = entry
+    return [best[k] for k in sorted(best)]
+
+def _columns(entries, *fields):
+    return [[entry[field] for entry in entries] for field in fields]
+
+async def _write_submissions(entries):
+    """Upsert a batch of submissions and best scores in one transaction"""
+    by_problem = _best_entries(entries, lambda e: (e["user_id"], e["problem_id"]))
+    by_user = _best_entries(entries, lambda e: e["user_id"])
+    async with db_connection() as conn, conn.transaction():
+        await conn.execute(
+            SUBMISSION_UPSERT,
+            *_columns(by_problem, "submission_id", "user_id", "problem_id", "score", "replay_result", "timestamp"),
+            [json.dumps(entry.get("error_details", [])) for entry in by_problem]
+        )
+        await conn.execute(
+            BEST_SCORE_UPSERT,
+            *_columns(by_user, "user_id", "submission_id", "problem_id", "score", "replay_result", "timestamp")
+        )
+
+class SubmissionWriter:
+    """Write-behind buffer grouping concurrent submissions into one transaction.
+
+    The first submission of a batch waits at most ``flush_interval`` seconds
+    for others to join (less once ``batch_size`` are pending). ``save``
+    returns only after the batch has committed.
+    """
+
+    def __init__(self, write, batch_size: int, flush_interval: float):
+        self._write = write
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._full = asyncio.Event()
+        self._task = None
+
+    async def save(self, entry: dict):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((entry, future))
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        await future
+
+    async def _run(self):
+        while self._pending:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        try:
+            await self._write([entry for entry, _ in batch])
+        except Exception as e:
+            if len(batch) > 1:
+                # Retry one by one so a single bad submission fails alone
+                for item in batch:
+                    await self._flush([item])
+                return
+            if not batch[0][1].done():
+                batch[0][1].set_exception(e)
+            return
+        for _, future in batch:
+            # A caller that gave up (cancelled) still had its row written.
+            if not future.done():
+                future.set_result(None)
+
+submission_writer = SubmissionWriter(_write_submissions, SUBMISSION_BATCH_SIZE, SUBMISSION_FLUSH_INTERVAL)
+
+async def save_submission(submission_entry: dict):
+    """Save a submission to the database
+
+    Concurrent calls are written together in one transaction; this returns
+    once the submission has been committed.
+    """
+    timestamp = submission_entry["timestamp"]
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    entry = dict(submission_entry, submission_id=str(submission_entry["submission_id"]), timestamp=timestamp)
+    try:
+        await submission_writer.save(entry)
+        return {"success": True}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+async def save_attempt(attempt: dict):
+    """Append a graded attempt to the submission history
+
+    ``attempt`` has the submission's id, user_id, problem_id, score, total,
+    replay_result, code_hash, timestamp and per-test ``results``.
+    """
+    timestamp = attempt["timestamp"]
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    try:
+        async with db_connection() as conn:
+            await _create_attempt_partition(conn, _month_start(timestamp))
+            await conn.execute(
+                """
+                INSERT INTO submission_attempts
+                    (id, user_id, problem_id, score, total, replay_result, code_hash, results, created_at)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8::jsonb, $9)
+                """,
+                str(attempt["submission_id"]),
+                attempt["user_id"],
+                attempt["problem_id"],
+                attempt["score"],
+                attempt["total"],
+                attempt["replay_result"],
+                attempt["code_hash"],
+                json.dumps(attempt["results"]),
+                timestamp
+            )
+        return {"success": True}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+def encode_cursor(entry: dict) -> str:
+    """Cursor pointing just past ``entry`` in (score DESC, timestamp, user_id) order"""
+    timestamp = entry["timestamp"]
+    if isinstance(timestamp, datetime):
+        timestamp = timestamp.isoformat()
+    raw = json.dumps([entry["score"], timestamp, entry["user_id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    """Return ``(score, timestamp, user_id)``; raise ValueError for a malformed cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        score, timestamp, user_id = json.loads(raw)
+        return int(score), datetime.fromisoformat(timestamp), str(user_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def parse_history_cursor(cursor: str):
+    """Return ``(created_at, id)``; raise ValueError for a malformed cursor"""
+    created_at, _, attempt_id = cursor.partition("|")
+    try:
+        return datetime.fromisoformat(created_at), uuid.UUID(attempt_id)
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+def _history_query(user_id, problem_id, limit, before):
+    """SQL and parameters for one page of attempts, newest first"""
+    conditions, params = [], []
+    if user_id is not None:
+        params.append(user_id)
+        conditions.append(f"user_id = ${len(params)}")
+    if problem_id is not None:
+        params.append(problem_id)
+        conditions.append(f"problem_id = ${len(params)}")
+    if before is not None:
+        params += parse_history_cursor(before)
+        conditions.append(f"(created_at, id) < (${len(params) - 1}, ${len(params)})")
+    query = ("SELECT id, user_id, problem_id, score, total, replay_result, code_hash, results, created_at "
+             "FROM submission_attempts")
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    params.append(limit)
+    query += f" ORDER BY created_at DESC, id DESC LIMIT ${len(params)}"
+    return query, params
+
+async def get_submission_history(user_id: str = None, problem_id: str = None, limit: int = HISTORY_PAGE_SIZE,
+                                 before: str = None):
+    """Retrieve one page of graded attempts, newest first
+
+    ``before`` is the ``next_cursor`` of the previous page.
+    """
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+    try:
+        query, params = _history_query(user_id, problem_id, limit, before)
+        async with db_connection() as conn:
+            rows = await conn.fetch(query, *params)
+        attempts = []
+        for row in rows:
+            attempt = dict(row)
+            attempt["results"] = json.loads(attempt["results"])
+            attempts.append(attempt)
+        next_cursor = None
+        if len(attempts) == limit:
+            next_cursor = f"{attempts[-1]['created_at'].isoformat()}|{attempts[-1]['id']}"
+        return {"success": True, "attempts": attempts, "next_cursor": next_cursor}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+def _leaderboard_query(problem_id, limit, after):
+    """SQL and parameters for one leaderboard page, seeking past the cursor
+
+    Ranks are ordered by ``(-score, timestamp, user_id)``, matching the rank
+    indexes, so a page is a range scan starting right after the cursor.
+    """
+    if problem_id is None:
+        query = "SELECT submission_id AS id, user_id, problem_id, score, replay_result, timestamp FROM best_scores"
+        conditions, params = [], []
+    else:
+        query = "SELECT id, user_id, problem_id, score, replay_result, timestamp FROM submissions"
+        conditions, params = ["problem_id = $1"], [problem_id]
+    if after is not None:
+        score, timestamp, user_id = decode_cursor(after)
+        n = len(params)
+        conditions.append(f"(-score, timestamp, user_id) > (${n + 1}, ${n + 2}, ${n + 3})")
+        params += [-score, timestamp, user_id]
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" ORDER BY -score, timestamp, user_id LIMIT ${len(params) + 1}"
+    params.append(limit)
+    return query, params
+
+async def get_leaderboard_data(problem_id: str = None, limit: int = LEADERBOARD_PAGE_SIZE, after: str = None):
+    """Retrieve one page of the leaderboard, best first
+
+    Without ``problem_id`` this is each user's single best submission across
+    all problems. ``after`` is the ``next_cursor`` of the previous page.
+    """
+    limit = max(1, min(limit, LEADERBOARD_MAX_PAGE_SIZE))
+    try:
+        query, params = _leaderboard_query(problem_id, limit, after)
+        async with db_connection() as conn:
+            rows = await conn.fetch(query, *params)
+        leaderboard = [dict(entry) for entry in rows]
+        next_cursor = encode_cursor(leaderboard[-1]) if len(leaderboard) == limit else None
+        return {"success": True, "leaderboard": leaderboard, "next_cursor": next_cursor}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
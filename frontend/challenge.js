@@ -53,6 +53,23 @@ if (!userData) {
   window.location.href = "auth.html";
 }
 
+// Request headers carrying the session token issued at login
+function authHeaders(headers = {}) {
+  if (userData && userData.access_token) {
+    headers.Authorization = `Bearer ${userData.access_token}`;
+  }
+  return headers;
+}
+
+// Send the user back to login when the session token was rejected
+function checkSession(response) {
+  if (response.status === 401) {
+    localStorage.removeItem("user");
+    window.location.href = "auth.html";
+    throw new Error("Session expired. Please log in again.");
+  }
+}
+
 // Initialize CodeMirror
 function initializeCodeEditor() {
   const textarea = document.getElementById("codeEditor");
@@ -1036,14 +1053,15 @@ async function runCode() {
 
     const response = await fetch(`${API_BASE}/api/run`, {
       method: "POST",
-      headers: {
+      headers: authHeaders({
         "Content-Type": "application/json",
-      },
+      }),
       body: JSON.stringify({
         problem_id: problemId,
         code: code,
       }),
     });
+    checkSession(response);
 
     const result = await response.json();
     hideLoading();
@@ -1190,20 +1208,21 @@ async function submitSolution() {
     showLoading("Evaluating your solution...");
     setSubmitButtonLoading(true);
 
-    console.log("Sending request to:", `${API_BASE}/api/submit`);
+    console.log("Sending request to:", `${API_BASE}/api/submit/stream`);
 
-    const response = await fetch(`${API_BASE}/api/submit`, {
+    const response = await fetch(`${API_BASE}/api/submit/stream`, {
       method: "POST",
-      headers: {
+      headers: authHeaders({
         "Content-Type": "application/json",
-        Accept: "application/json",
-      },
+        Accept: "text/event-stream, application/json",
+      }),
       body: JSON.stringify({
         user_id: username,
         problem_id: problemId,
         code: code,
       }),
     });
+    checkSession(response);
 
     console.log("Response status:", response.status);
 
@@ -1213,7 +1232,14 @@ async function submitSolution() {
       throw new Error(`HTTP error! status: ${response.status} - ${errorText}`);
     }
 
-    const result = await response.json();
+    let result;
+    if (response.status === 202) {
+      // The server queued the submission; poll until it has been graded.
+      const queued = await response.json();
+      result = await waitForSubmission(queued.submission_id);
+    } else {
+      result = await readGradingStream(response);
+    }
     console.log("Result received:", result);
 
     hideLoading();
@@ -1236,6 +1262,65 @@ async function submitSolution() {
   }
 }
 
+// Read per-test progress events until the final grading result arrives
+async function readGradingStream(response) {
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) {
+      throw new Error("Grading stream ended unexpectedly");
+    }
+    buffer += decoder.decode(value, { stream: true });
+
+    let boundary;
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const rawEvent = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+
+      let type = "message";
+      let data = "";
+      rawEvent.split("\n").forEach((line) => {
+        if (line.startsWith("event: ")) type = line.slice(7);
+        else if (line.startsWith("data: ")) data += line.slice(6);
+      });
+      const payload = JSON.parse(data);
+
+      if (type === "test") {
+        showLoading(
+          `Evaluating your solution... test ${payload.test}/${payload.total} ${
+            payload.passed ? "✅" : "❌"
+          }`
+        );
+      } else if (type === "done") {
+        return payload;
+      } else if (type === "error") {
+        throw new Error(payload.detail);
+      }
+    }
+  }
+}
+
+// Poll a queued submission until grading has finished
+async function waitForSubmission(submissionId) {
+  while (true) {
+    await new Promise((resolve) => setTimeout(resolve, 500));
+    const response = await fetch(`${API_BASE}/api/submission/${submissionId}`);
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    const job = await response.json();
+    if (job.status === "done") {
+      return job.result;
+    }
+    if (job.status === "failed") {
+      throw new Error(`Grading failed: ${job.error}`);
+    }
+  }
+}
+
 // Display submission results
 function displayResults(result) {
   const grade = result.grade;
@@ -1,97 +1,532 @@
+import hashlib
+import signal
 import subprocess
-import tempfile
-import json
 import uuid
 import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime
 
-def grade_submission(code: str, problem_id: str, user_id: str):
+from batch_runner import run_batch
+from problems import problem_registry
+from result_cache import ResultCache
+from sandbox import (
+    CaseResult, CpuTimeExceeded, WallTimeExceeded, limited_command, make_usage, out_of_memory, rusage_cpu,
+    wait_exit,
+)
+from staging import staged
+from worker_pool import WorkerPool
+
+# "subprocess" starts a fresh interpreter per test case; "pool" reuses warm,
+# pre-imported workers (see worker_pool.py); "batch" runs all test cases of a
+# submission in one child process (see batch_runner.py).
+GRADER_BACKEND = os.getenv("GRADER_BACKEND", "subprocess")
+GRADER_POOL_SIZE = int(os.getenv("GRADER_POOL_SIZE", os.cpu_count() or 2))
+GRADER_POOL_MAX_JOBS = int(os.getenv("GRADER_POOL_MAX_JOBS", 50))
+# Test cases of one submission run concurrently, up to GRADER_CASE_CONCURRENCY
+# at a time; GRADER_MAX_CONCURRENT_CASES bounds them across all submissions
+# graded by this process.
+GRADER_CASE_CONCURRENCY = int(os.getenv("GRADER_CASE_CONCURRENCY", 4))
+GRADER_MAX_CONCURRENT_CASES = int(os.getenv("GRADER_MAX_CONCURRENT_CASES", os.cpu_count() or 2))
+
+TIMEOUT_SECONDS = 5
+
+# Default limits of every test case (see sandbox.py); a problem or a single
+# test may set its own ``time_limit_ms`` and ``memory_limit_mb`` (see
+# problem_limits). TIMEOUT_SECONDS is the CPU time a test may use; a test
+# that has not finished after GRADER_WALL_TIMEOUT_FACTOR times its limit in
+# wall time is reported as a stall.
+# GRADER_MEMORY_LIMIT_MB=0 lifts the address-space limit; a negative
+# GRADER_MAX_PROCESSES leaves RLIMIT_NPROC alone.
+GRADER_MEMORY_LIMIT_MB = int(os.getenv("GRADER_MEMORY_LIMIT_MB", 256))
+GRADER_WALL_TIMEOUT_FACTOR = float(os.getenv("GRADER_WALL_TIMEOUT_FACTOR", 2))
+GRADER_MAX_PROCESSES = int(os.getenv("GRADER_MAX_PROCESSES", 0))
+_max_processes = GRADER_MAX_PROCESSES if GRADER_MAX_PROCESSES >= 0 else None
+
+# Appended to every submission: runs the solution, which reads the test input
+# from stdin.
+SOLVE_FOOTER = "\n\nsolve()\n"
+
+# How often a running test case checks whether it has been cancelled.
+POLL_INTERVAL = 0.05
+
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+# Grading results are cached by normalized code and problem content (see
+# result_cache.py). GRADER_CACHE_SIZE=0 disables the cache; GRADER_CACHE_DIR
+# also keeps results on disk.
+GRADER_CACHE_SIZE = int(os.getenv("GRADER_CACHE_SIZE", 1000))
+GRADER_CACHE_MAX_BYTES = int(os.getenv("GRADER_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+GRADER_CACHE_DIR = os.getenv("GRADER_CACHE_DIR")
+
+# Fields of a grading result that do not depend on who submitted the code;
+# they are cached and shared between identical submissions.
+CACHED_FIELDS = ("score", "total", "skipped", "replay_result", "error_details", "test_results")
+UNCACHEABLE_VERDICTS = ("time_limit_exceeded", "wall_timeout", "error")
+
+_result_cache = None
+
+_case_executor = ThreadPoolExecutor(max_workers=GRADER_MAX_CONCURRENT_CASES, thread_name_prefix="grader")
+
+def get_worker_pool():
+    """Return the process-wide worker pool, starting it on first use."""
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = WorkerPool(GRADER_POOL_SIZE, max_jobs_per_worker=GRADER_POOL_MAX_JOBS,
+                                      memory_mb=GRADER_MEMORY_LIMIT_MB, max_processes=_max_processes)
+        return _worker_pool
+
+def get_result_cache():
+    """Return the process-wide grading result cache, or None if disabled."""
+    global _result_cache
+    if GRADER_CACHE_SIZE <= 0:
+        return None
+    with _worker_pool_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache(GRADER_CACHE_SIZE, GRADER_CACHE_MAX_BYTES, GRADER_CACHE_DIR)
+        return _result_cache
+
+def shutdown_worker_pool():
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is not None:
+            _worker_pool.shutdown()
+            _worker_pool = None
+
+def _write_input(stream, data: str):
     try:
-        with open(f"test_cases/{problem_id}.json", "r") as f:
-            test_data = json.load(f)
-    except FileNotFoundError:
-        raise FileNotFoundError(f"Test cases for '{problem_id}' not found.")
+        stream.write(data)
+        stream.close()
+    except OSError:
+        # The child exited (or closed stdin) without reading all of it.
+        pass
 
-    all_tests = test_data.get("public_tests", []) + test_data.get("hidden_tests", [])
-    total_cases = len(all_tests)
-    passed_count = 0
-    error_details = []
+def _communicate(proc, timeout: float, cancel=None, cpu_limit: float = None, input_data: str = None):
+    """Like ``proc.communicate(input_data, timeout=...)``, but also stops when ``cancel`` is set.
 
-    for i, case in enumerate(all_tests):
-        tmp_file = None
-        try:
-            with tempfile.NamedTemporaryFile(mode='w+', suffix='.py', delete=False) as tmp:
-                tmp_file = tmp.name
-                tmp.write(code + "\n")
-                tmp.write("""
-if __name__ == "__main__":
-    import sys
-    from io import StringIO
-
-    input_data = \"\"\"{}\"\"\"
-    sys.stdin = StringIO(input_data)
-
-    solve()
-""".format(case["input"]))
-                tmp.flush()
-
-            try:
-                result = subprocess.run(
-                    ["python", tmp_file],
-                    capture_output=True,
-                    text=True,
-                    timeout=5  # Increased timeout to 5 seconds
-                )
-                
-                if result.returncode != 0:
-                    error_details.append(f"Test {i+1}: Runtime error - {result.stderr.strip()}")
-                    continue
-                
-                user_output = result.stdout.strip()
-                expected_output = case["expected_output"].strip()
-
-                # Normalize whitespace for comparison (remove all spaces)
-                user_output_normalized = user_output.replace(" ", "")
-                expected_output_normalized = expected_output.replace(" ", "")
-
-                if user_output_normalized == expected_output_normalized:
-                    passed_count += 1
-                else:
-                    error_details.append(f"Test {i+1}: Expected '{expected_output}', got '{user_output}'")
-                    
-            except subprocess.TimeoutExpired:
-                error_details.append(f"Test {i+1}: Timeout (exceeded 5 seconds)")
-                continue
-            except Exception as e:
-                error_details.append(f"Test {i+1}: Execution error - {str(e)}")
-                continue
-                
-        finally:
-            # Clean up temporary file
-            if tmp_file and os.path.exists(tmp_file):
-                try:
-                    os.unlink(tmp_file)
-                except OSError:
-                    pass
+    The child is reaped with ``os.wait4`` so its CPU time and peak memory can
+    be reported: returns a ``CaseResult``, raises ``WallTimeExceeded`` after
+    ``timeout`` seconds and ``CpuTimeExceeded`` if it used more than
+    ``cpu_limit`` seconds of CPU.
+    """
+    start = time.perf_counter()
+    deadline = time.monotonic() + timeout
+    output = {}
+    io_threads = [
+        threading.Thread(target=lambda name, stream: output.__setitem__(name, stream.read()),
+                         args=(name, stream), daemon=True)
+        for name, stream in (("stdout", proc.stdout), ("stderr", proc.stderr))
+    ]
+    if proc.stdin is not None:
+        # Written from a thread so a large input cannot deadlock against the
+        # child filling its stdout pipe.
+        io_threads.append(threading.Thread(target=_write_input, args=(proc.stdin, input_data or ""), daemon=True))
+    for thread in io_threads:
+        thread.start()
+    stopped = None
+    while not wait_exit(proc.pid, min(POLL_INTERVAL, max(0, deadline - time.monotonic()))):
+        if cancel is not None and cancel.is_set():
+            stopped = "cancelled"
+        elif time.monotonic() >= deadline:
+            stopped = "timeout"
+        if stopped:
+            proc.kill()
+            break
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    for thread in io_threads:
+        thread.join(timeout=1)
+    usage = make_usage(time.perf_counter() - start, rusage_cpu(rusage), rusage.ru_maxrss)
 
-    replay_result = "passed" if passed_count == total_cases else (
-        "partially" if passed_count > 0 else "failed"
+    if stopped == "cancelled":
+        raise CancelledError()
+    if cpu_limit is not None and (proc.returncode == -signal.SIGXCPU or rusage_cpu(rusage) > cpu_limit):
+        raise CpuTimeExceeded(proc.args, cpu_limit, usage)
+    if stopped == "timeout":
+        raise WallTimeExceeded(proc.args, timeout, usage)
+    stdout, stderr = output.get("stdout", ""), output.get("stderr", "")
+    usage["memory_exceeded"] = out_of_memory(proc.returncode, stderr)
+    return CaseResult(proc.args, proc.returncode, stdout, stderr, usage)
+
+def _run_case_subprocess(script: str, test_input: str, timeout: float, cancel=None, cpu_limit: float = None,
+                         memory_mb: int = None):
+    """Run the staged ``script``; the input is not part of it but fed through stdin."""
+    proc = subprocess.Popen(
+        limited_command(["python", script], cpu_limit, memory_mb, _max_processes),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True
     )
+    return _communicate(proc, timeout, cancel, cpu_limit, test_input)
+
+def problem_limits(test_data: dict, case: dict = None) -> dict:
+    """Return the ``time_limit_ms`` and ``memory_limit_mb`` of a problem or of one of its tests.
+
+    A test's own limits override the problem's, which override the grader
+    defaults (``TIMEOUT_SECONDS`` and ``GRADER_MEMORY_LIMIT_MB``).
+    """
+    limits = {"time_limit_ms": TIMEOUT_SECONDS * 1000, "memory_limit_mb": GRADER_MEMORY_LIMIT_MB}
+    for source in (test_data, case or {}):
+        for field in limits:
+            if source.get(field) is not None:
+                limits[field] = source[field]
+    return limits
+
+def run_case(code: str, test_input: str, timeout: float = None, cancel=None, memory_mb: int = None,
+             script: str = None):
+    """Run ``code`` against one input using the configured backend.
+
+    ``timeout`` is the CPU time limit in seconds (default
+    ``TIMEOUT_SECONDS``) and ``memory_mb`` the memory limit (default
+    ``GRADER_MEMORY_LIMIT_MB``). Returns a ``sandbox.CaseResult`` (a
+    ``subprocess.CompletedProcess`` with a ``usage`` record) and raises
+    ``sandbox.CpuTimeExceeded`` when the limit is used up, or
+    ``sandbox.WallTimeExceeded`` (a ``subprocess.TimeoutExpired``) when there
+    is no result after ``GRADER_WALL_TIMEOUT_FACTOR`` times the limit,
+    whichever backend is used. Setting the optional ``cancel`` event kills
+    the run and raises ``concurrent.futures.CancelledError``.
+
+    The subprocess backend runs ``code`` from a staged file (see staging.py);
+    pass the path of one already staged with ``stage_code`` as ``script`` to
+    reuse it across tests.
+    """
+    if timeout is None:
+        timeout = TIMEOUT_SECONDS
+    if memory_mb is None:
+        memory_mb = GRADER_MEMORY_LIMIT_MB
+    wall_timeout = timeout * GRADER_WALL_TIMEOUT_FACTOR
+    if GRADER_BACKEND == "pool":
+        return get_worker_pool().run(code, test_input, wall_timeout, cancel=cancel, cpu_limit=timeout,
+                                     memory_mb=memory_mb)
+    if script is not None:
+        return _run_case_subprocess(script, test_input, wall_timeout, cancel=cancel, cpu_limit=timeout,
+                                    memory_mb=memory_mb)
+    with staged(code + SOLVE_FOOTER) as script:
+        return _run_case_subprocess(script, test_input, wall_timeout, cancel=cancel, cpu_limit=timeout,
+                                    memory_mb=memory_mb)
+
+def stage_code(code: str):
+    """Stage ``code`` once for several ``run_case`` calls.
+
+    A context manager yielding the staged path, or None for the pool backend,
+    which does not run files. ``run_case`` has no batch path, so the batch
+    backend stages like the subprocess one.
+    """
+    if GRADER_BACKEND == "pool":
+        return nullcontext()
+    return staged(code + SOLVE_FOOTER)
+
+def _run_case_outcome(code: str, test_input: str, limits, script, cancel):
+    if cancel.is_set():
+        return CancelledError(), make_usage(0.0)
+    timeout, memory_mb = limits
+    start = time.perf_counter()
+    try:
+        outcome = run_case(code, test_input, timeout, cancel=cancel, memory_mb=memory_mb, script=script)
+    except Exception as e:
+        outcome = e
+    return outcome, getattr(outcome, "usage", None) or make_usage(time.perf_counter() - start)
+
+def _run_batch_chunk(code: str, inputs: list, limits: list, futures: list, cancel):
+    # The submission may have stopped (or been abandoned) while this chunk was queued.
+    if cancel.is_set():
+        for future in futures:
+            future.cancel()
+        return
+    try:
+        batch_limits = [(timeout * GRADER_WALL_TIMEOUT_FACTOR, timeout, memory_mb) for timeout, memory_mb in limits]
+        outcomes = run_batch(code, inputs, batch_limits, cancel=cancel, max_processes=_max_processes)
+        for future, outcome in zip(futures, outcomes):
+            future.set_result(outcome)
+    except Exception as e:
+        for future in futures:
+            if not future.done():
+                future.set_result((e, make_usage(0.0)))
+
+def _submit_batch(code: str, inputs: list, limits: list, cancel):
+    """Split ``inputs`` into contiguous chunks, one batch process per chunk."""
+    futures = [Future() for _ in inputs]
+    chunks = max(1, min(GRADER_CASE_CONCURRENCY, len(inputs)))
+    size = -(-len(inputs) // chunks)
+    for start in range(0, len(inputs), size):
+        chunk = slice(start, start + size)
+        _case_executor.submit(_run_batch_chunk, code, inputs[chunk], limits[chunk], futures[chunk], cancel)
+    return futures
+
+def run_cases(code: str, inputs: list, limits: list = None):
+    """Yield one ``(outcome, usage)`` pair per input, in order.
+
+    ``limits`` holds one ``(time limit in seconds, memory limit in MB)`` pair
+    per input; by default every case gets the grader defaults. Cases run
+    concurrently on the shared case executor, at most
+    ``GRADER_CASE_CONCURRENCY`` at a time for this submission. An outcome is a
+    ``sandbox.CaseResult``, or the exception raised while running the case
+    (``CpuTimeExceeded`` or ``WallTimeExceeded`` on timeout); ``usage`` is its
+    ``sandbox.make_usage`` record (wall time, CPU time, peak memory). Closing
+    the generator early kills the cases still running and drops those not yet
+    started.
+    """
+    if limits is None:
+        limits = [(TIMEOUT_SECONDS, GRADER_MEMORY_LIMIT_MB)] * len(inputs)
+    cancel = threading.Event()
+    pending = deque()
+    try:
+        if GRADER_BACKEND == "batch":
+            pending.extend(_submit_batch(code, inputs, limits, cancel))
+            while pending:
+                yield pending.popleft().result()
+            return
+        with stage_code(code) as script:
+            remaining = iter(zip(inputs, limits))
+            for test_input, case_limits in remaining:
+                pending.append(
+                    _case_executor.submit(_run_case_outcome, code, test_input, case_limits, script, cancel)
+                )
+                if len(pending) >= GRADER_CASE_CONCURRENCY:
+                    break
+            while pending:
+                outcome = pending.popleft().result()
+                following = next(remaining, None)
+                if following is not None:
+                    pending.append(_case_executor.submit(_run_case_outcome, code, *following, script, cancel))
+                yield outcome
+    finally:
+        if pending:
+            cancel.set()
+            for future in pending:
+                future.cancel()
 
-    submission_entry = {
+def _check_result(i: int, case: dict, result, usage: dict, memory_mb: int):
+    """Return ``(verdict, error)`` for test ``i``; the error is None if it passed."""
+    if isinstance(result, CpuTimeExceeded):
+        return "time_limit_exceeded", f"Test {i+1}: Time limit exceeded (over {result.cpu_limit:g} seconds of CPU time)"
+    if isinstance(result, subprocess.TimeoutExpired):
+        return "wall_timeout", f"Test {i+1}: Timeout (no result after {result.timeout:g} seconds)"
+    if isinstance(result, Exception):
+        return "error", f"Test {i+1}: Execution error - {str(result)}"
+
+    if result.returncode != 0:
+        if usage["memory_exceeded"]:
+            return "memory_limit_exceeded", f"Test {i+1}: Memory limit exceeded ({memory_mb} MB)"
+        return "runtime_error", f"Test {i+1}: Runtime error - {result.stderr.strip()}"
+
+    user_output = result.stdout.strip()
+    expected_output = case["expected_output"].strip()
+
+    # Normalize whitespace for comparison (remove all spaces)
+    user_output_normalized = user_output.replace(" ", "")
+    expected_output_normalized = expected_output.replace(" ", "")
+
+    if user_output_normalized == expected_output_normalized:
+        return "passed", None
+    return "wrong_answer", f"Test {i+1}: Expected '{expected_output}', got '{user_output}'"
+
+def limit_errors(error_details: list, limit: int, skipped: int = 0) -> list:
+    """The first ``limit`` errors, keeping the trailing "Skipped" line if tests were skipped."""
+    if not skipped:
+        return error_details[:limit]
+    return error_details[:-1][:limit] + error_details[-1:]
+
+def _submission_entry(user_id: str, problem_id: str, score: int, replay_result: str, error_details: list,
+                      skipped: int = 0):
+    return {
         "submission_id": str(uuid.uuid4()),
         "user_id": user_id,
         "problem_id": problem_id,
-        "score": passed_count,
+        "score": score,
         "replay_result": replay_result,
         "timestamp": datetime.utcnow(),
-        "error_details": error_details[:3]  # Limit to first 3 errors for brevity
+        "error_details": limit_errors(error_details, 3, skipped)  # Limit to first 3 errors for brevity
     }
 
+def _shared_result(shared: dict, code: str, problem_id: str, user_id: str, cached: bool = False,
+                   joined: bool = False):
+    """Build this submission's result from a grading run it may share with others."""
+    result = {field: shared[field] for field in CACHED_FIELDS}
+    result["submission_entry"] = _submission_entry(
+        user_id, problem_id, result["score"], result["replay_result"], result["error_details"], result["skipped"]
+    )
+    result["code_hash"] = hashlib.sha256(code.encode("utf-8")).hexdigest()
+    result["cached"] = cached
+    result["joined"] = joined
+    return result
+
+class _Flight:
+    """A grading run in progress that identical submissions can join."""
+
+    def __init__(self):
+        self.events = []
+        self._done = False
+        self._shared = None
+        self._error = None
+        self._cond = threading.Condition()
+
+    def publish(self, event: dict):
+        with self._cond:
+            self.events.append(event)
+            self._cond.notify_all()
+
+    def finish(self, shared=None, error=None):
+        with self._cond:
+            self._shared, self._error, self._done = shared, error, True
+            self._cond.notify_all()
+
+    def follow(self, on_result=None):
+        """Wait for the run, passing each of its events to ``on_result``; return its shared result."""
+        seen = 0
+        while True:
+            with self._cond:
+                while seen == len(self.events) and not self._done:
+                    self._cond.wait()
+                new_events = self.events[seen:]
+                seen = len(self.events)
+                done = self._done
+            if on_result is not None:
+                for event in new_events:
+                    on_result(dict(event))
+            if done:
+                break
+        if self._error is not None:
+            raise self._error
+        return self._shared
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+_single_flight_stats = {"runs": 0, "joined": 0}
+
+def single_flight_metrics():
+    """Gradings in progress and how many submissions joined one instead of running."""
+    with _in_flight_lock:
+        return {"in_flight": len(_in_flight), **_single_flight_stats}
+
+def _run_tests(code: str, test_data: dict, all_tests: list, max_failures, publish):
+    """Grade ``code``; return the user-independent part of the result."""
+    total_cases = len(all_tests)
+    passed_count = 0
+    error_details = []
+    test_results = []
+    events = []
+
+    failed_count = 0
+    skipped_count = 0
+
+    limits = []
+    for case in all_tests:
+        case_limits = problem_limits(test_data, case)
+        limits.append((case_limits["time_limit_ms"] / 1000, case_limits["memory_limit_mb"]))
+    outcomes = run_cases(code, [case["input"] for case in all_tests], limits)
+    for i, (case, (result, usage)) in enumerate(zip(all_tests, outcomes)):
+        verdict, error = _check_result(i, case, result, usage, limits[i][1])
+        test_results.append({
+            "test": i + 1,
+            "verdict": verdict,
+            "time_ms": usage["wall_ms"],
+            "cpu_ms": usage["cpu_ms"],
+            "memory_kb": usage["memory_kb"],
+        })
+        event = {"test": i + 1, "total": total_cases, "passed": error is None, "error": error}
+        events.append(event)
+        publish(event)
+        if error is None:
+            passed_count += 1
+            continue
+        error_details.append(error)
+        failed_count += 1
+        if max_failures is not None and failed_count >= max_failures and i + 1 < total_cases:
+            outcomes.close()
+            skipped_count = total_cases - (i + 1)
+            break
+
+    error_details = error_details[:5]  # Return some error details for debugging
+    if skipped_count:
+        error_details.append(f"Tests {total_cases-skipped_count+1}-{total_cases}: Skipped after {failed_count} failure(s)")
+
+    replay_result = "passed" if passed_count == total_cases else (
+        "partially" if passed_count > 0 else "failed"
+    )
+
     return {
         "score": passed_count,
         "total": total_cases,
+        "skipped": skipped_count,
         "replay_result": replay_result,
-        "submission_entry": submission_entry,
-        "error_details": error_details[:5]  # Return some error details for debugging
+        "error_details": error_details,
+        "test_results": test_results,
+        "events": events
     }
+
+def grade_submission(code: str, problem_id: str, user_id: str, fail_fast: bool = False, max_failures: int = None,
+                     on_result=None):
+    """Run ``code`` against every test of ``problem_id``.
+
+    With ``max_failures`` set, grading stops once that many tests have failed
+    and the remaining tests are reported as skipped; ``fail_fast`` is the
+    all-or-nothing case, ``max_failures=1``. ``on_result``, if given, is called
+    with a ``{"test", "total", "passed", "error"}`` dict as soon as each test
+    has been checked.
+
+    The result also carries ``test_results``, one record per test that ran
+    (verdict, wall time and, where measured, CPU time and peak memory), and the
+    ``code_hash`` of the submission, for the submission history. Results of
+    code already graded against the same tests come from the result cache
+    (``"cached": True``); a submission identical to one being graded right
+    now waits for that run and shares its result (``"joined": True``).
+    """
+    test_data, problem_hash = problem_registry.get_with_hash(problem_id)
+    if test_data is None:
+        raise FileNotFoundError(f"Test cases for '{problem_id}' not found.")
+
+    if fail_fast:
+        max_failures = 1
+
+    key = ResultCache.key(code, problem_hash, {
+        "max_failures": max_failures,
+        "timeout": TIMEOUT_SECONDS,
+        "memory_mb": GRADER_MEMORY_LIMIT_MB,
+    })
+    cache = get_result_cache()
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            if on_result is not None:
+                for event in cached["events"]:
+                    on_result(dict(event))
+            return _shared_result(cached, code, problem_id, user_id, cached=True)
+
+    # Identical submissions graded at the same time share one run.
+    with _in_flight_lock:
+        flight = _in_flight.get(key)
+        leader = flight is None
+        if leader:
+            flight = _in_flight[key] = _Flight()
+            _single_flight_stats["runs"] += 1
+        else:
+            _single_flight_stats["joined"] += 1
+    if not leader:
+        return _shared_result(flight.follow(on_result), code, problem_id, user_id, joined=True)
+
+    def publish(event):
+        flight.publish(event)
+        if on_result is not None:
+            on_result(dict(event))
+
+    try:
+        all_tests = test_data.get("public_tests", []) + test_data.get("hidden_tests", [])
+        shared = _run_tests(code, test_data, all_tests, max_failures, publish)
+        # Timeouts and execution errors depend on load, not just on the code.
+        if cache is not None and all(t["verdict"] not in UNCACHEABLE_VERDICTS for t in shared["test_results"]):
+            cache.put(key, shared)
+        flight.finish(shared)
+    except BaseException as e:
+        flight.finish(error=e)
+        raise
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
+    return _shared_result(shared, code, problem_id, user_id)
@@ -0,0 +1,314 @@
+"""Incrementally maintained leaderboard and its on-disk log.
+
+Entries are keyed by ``(user_id, problem_id)``; only a user's best submission
+per problem is kept. Each problem has a list of rank keys kept sorted with
+``bisect``, so recording a submission does not regroup or re-sort the whole
+history. The rendered leaderboard is cached until the next change.
+
+``LeaderboardLog`` persists it as a snapshot (``leaderboard.json``) plus an
+append-only log of accepted entries, so each submission costs one appended
+line instead of a rewrite of the whole file. It is owned by one process.
+
+``SqliteLeaderboard`` instead keeps the entries in a SQLite (WAL) database
+shared by every uvicorn worker on the host, and mirrors it in memory.
+"""
+import bisect
+import heapq
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def _rank_key(entry: dict):
+    return (-entry["score"], entry["timestamp"], entry["user_id"], entry["problem_id"])
+
+
+class Leaderboard:
+    def __init__(self, entries=()):
+        self._entries = {}
+        self._by_problem = {}
+        self._rendered = {}
+        self._lock = threading.Lock()
+        # Bumped on every change; lets callers cache anything derived from it.
+        self.version = 0
+        for entry in entries:
+            self.submit(entry)
+
+    def submit(self, entry: dict) -> bool:
+        """Record a graded submission. Returns True if the leaderboard changed.
+
+        An existing entry is only replaced by a strictly higher score.
+        """
+        key = (entry["user_id"], entry["problem_id"])
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is not None and entry["score"] <= existing["score"]:
+                return False
+            ranks = self._by_problem.setdefault(entry["problem_id"], [])
+            if existing is not None:
+                del ranks[bisect.bisect_left(ranks, _rank_key(existing))]
+            bisect.insort(ranks, _rank_key(entry))
+            self._entries[key] = entry
+            self._rendered = {}
+            self.version += 1
+            return True
+
+    def sync(self):
+        """Pick up changes made elsewhere. Nothing to do for a local leaderboard."""
+
+    def entries(self):
+        """Return every entry, e.g. for persisting the leaderboard."""
+        with self._lock:
+            return list(self._entries.values())
+
+    def problem_ids(self):
+        return list(self._by_problem)
+
+    def render(self, problem_id: str = None):
+        """Return the leaderboard rows, best first, optionally for one problem."""
+        with self._lock:
+            rendered = self._rendered.get(problem_id)
+            if rendered is None:
+                if problem_id is None:
+                    keys = heapq.merge(*self._by_problem.values())
+                else:
+                    keys = self._by_problem.get(problem_id, [])
+                rendered = []
+                for _, _, user_id, pid in keys:
+                    entry = self._entries[(user_id, pid)]
+                    rendered.append({
+                        "user_id": user_id,
+                        "problem_id": pid,
+                        "score": entry["score"],
+                        "replay_result": entry["replay_result"],
+                        "timestamp": entry["timestamp"]
+                    })
+                self._rendered[problem_id] = rendered
+            return rendered
+
+
+class SqliteLeaderboard(Leaderboard):
+    """A leaderboard stored in SQLite and shared between processes.
+
+    Writes go through a short ``BEGIN IMMEDIATE`` transaction, which SQLite
+    serializes across processes. Every row carries a sequence number bumped
+    on each change; ``sync`` checks ``PRAGMA data_version`` (which changes
+    when another connection commits) and only then loads rows newer than the
+    last one seen into the in-memory index. Reads are served from memory;
+    ``sync`` uses its own connection, which WAL mode keeps from waiting on
+    writers, so it never queues behind a ``submit`` waiting for the write lock.
+    """
+
+    def __init__(self, path: str, seed_entries=()):
+        super().__init__()
+        self.path = path
+        self._db_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._last_seq = 0
+        self._data_version = None
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS leaderboard_entries (
+                user_id TEXT NOT NULL,
+                problem_id TEXT NOT NULL,
+                score INTEGER NOT NULL,
+                seq INTEGER NOT NULL,
+                entry TEXT NOT NULL,
+                PRIMARY KEY (user_id, problem_id)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS leaderboard_entries_seq ON leaderboard_entries (seq)")
+        self._read_conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._seed(seed_entries)
+        self.sync()
+
+    def _seed(self, entries):
+        """Import ``entries`` (e.g. an existing leaderboard.json) into an empty database."""
+        with self._db_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                empty = self._conn.execute("SELECT 1 FROM leaderboard_entries LIMIT 1").fetchone() is None
+                if empty:
+                    for entry in entries:
+                        self._upsert(entry)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _upsert(self, entry: dict) -> bool:
+        seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM leaderboard_entries").fetchone()[0]
+        cursor = self._conn.execute("""
+            INSERT INTO leaderboard_entries (user_id, problem_id, score, seq, entry)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, problem_id) DO UPDATE SET
+                score = excluded.score, seq = excluded.seq, entry = excluded.entry
+            WHERE excluded.score > leaderboard_entries.score
+        """, (entry["user_id"], entry["problem_id"], entry["score"], seq, json.dumps(entry, default=str)))
+        return cursor.rowcount > 0
+
+    def submit(self, entry: dict) -> bool:
+        with self._db_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                changed = self._upsert(entry)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if changed:
+            # Mirror our own write now; sync() will see the row again later,
+            # which is harmless since an equal score never replaces an entry.
+            super().submit(json.loads(json.dumps(entry, default=str)))
+        return changed
+
+    def sync(self):
+        with self._read_lock:
+            data_version = self._read_conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version:
+                return
+            self._data_version = data_version
+            rows = self._read_conn.execute(
+                "SELECT seq, entry FROM leaderboard_entries WHERE seq > ? ORDER BY seq", (self._last_seq,)
+            ).fetchall()
+            for seq, entry in rows:
+                super().submit(json.loads(entry))
+                self._last_seq = max(self._last_seq, seq)
+
+
+class LeaderboardLog:
+    """Snapshot plus append-only JSON-lines log of accepted entries.
+
+    ``append`` writes one line and hands it to the OS; a background thread
+    fsyncs the log at most every ``fsync_interval`` seconds. After
+    ``compact_every`` appended entries the log is rotated and a fresh
+    snapshot is written to a temporary file and atomically renamed over the
+    old one. Replaying an entry that is already in the snapshot is a no-op,
+    so a crash at any point leaves a loadable state. A rotated log left
+    behind by a crash is folded into the snapshot before it can be replaced.
+    """
+
+    def __init__(self, snapshot_path: str, fsync_interval: float = 0.05, compact_every: int = 1000):
+        self.snapshot_path = snapshot_path
+        self.log_path = os.path.splitext(snapshot_path)[0] + ".log"
+        self.rotated_path = self.log_path + ".1"
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._closed = False
+        self._log = None
+        self._appended = 0
+        self._log_end = None  # bytes of complete lines in the log, as read by load()
+        self._entries_fn = None
+        self._syncer = None
+
+    def load(self):
+        """Return the snapshot entries followed by every logged entry."""
+        entries = []
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r") as f:
+                entries.extend(json.load(f))
+        for path in (self.rotated_path, self.log_path):
+            if not os.path.exists(path):
+                continue
+            end = 0
+            with open(path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # A torn final line from a crash mid-append.
+                        break
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        break
+                    end += len(line)
+            if path == self.log_path:
+                self._log_end = end
+        return entries
+
+    def open(self, entries_fn):
+        """Start appending. ``entries_fn`` returns all entries for snapshots,
+        including those ``load`` returned."""
+        self._entries_fn = entries_fn
+        if os.path.exists(self.rotated_path):
+            self._merge_rotated()
+        if self._log_end is not None and os.path.exists(self.log_path) \
+                and os.path.getsize(self.log_path) > self._log_end:
+            # Drop a torn line so new entries do not get glued onto it.
+            os.truncate(self.log_path, self._log_end)
+        self._log = open(self.log_path, "a")
+        self._syncer = threading.Thread(target=self._sync_loop, name="leaderboard-fsync", daemon=True)
+        self._syncer.start()
+
+    def append(self, entry: dict):
+        with self._lock:
+            self._log.write(json.dumps(entry, default=str) + "\n")
+            self._log.flush()
+            self._appended += 1
+            compact = self._appended == self.compact_every
+        self._dirty.set()
+        if compact:
+            threading.Thread(target=self.compact, name="leaderboard-compact", daemon=True).start()
+
+    def compact(self):
+        """Write a fresh snapshot and drop the log entries it covers."""
+        with self._compact_lock:
+            with self._lock:
+                # Entries are added to the leaderboard before they are logged,
+                # so everything in the rotated log is in the entries taken here.
+                self._log.flush()
+                os.fsync(self._log.fileno())
+                if os.path.exists(self.rotated_path):
+                    # A previous compaction failed after rotating.
+                    self._merge_rotated()
+                self._log.close()
+                os.replace(self.log_path, self.rotated_path)
+                self._log = open(self.log_path, "a")
+                self._appended = 0
+                entries = self._entries_fn()
+            self._write_snapshot(entries)
+            os.remove(self.rotated_path)
+
+    def _merge_rotated(self):
+        """Snapshot every entry so the rotated log is no longer needed, then remove it."""
+        self._write_snapshot(self._entries_fn())
+        os.remove(self.rotated_path)
+
+    def _write_snapshot(self, entries: list):
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f, indent=2, default=str)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _sync_loop(self):
+        while not self._closed:
+            self._dirty.wait()
+            self._dirty.clear()
+            with self._lock:
+                if self._log is None or self._log.closed:
+                    continue
+                # fsync a duplicate so appends are not blocked while it runs.
+                fd = os.dup(self._log.fileno())
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            time.sleep(self.fsync_interval)
+
+    def close(self):
+        """Compact, then stop the fsync thread."""
+        if self._log is None:
+            return
+        self.compact()
+        self._closed = True
+        self._dirty.set()
+        with self._lock:
+            self._log.close()
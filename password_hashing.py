@@ -0,0 +1,143 @@
+"""Argon2 password hashing on a dedicated, bounded thread pool.
+
+Argon2 is deliberately slow and memory hungry, so hashes are computed on a
+small pool of ``PASSWORD_HASH_WORKERS`` threads (argon2-cffi releases the GIL
+while hashing) instead of on the request path. At most
+``PASSWORD_HASH_MAX_PENDING`` hashes may be queued or running; beyond that
+``PasswordHashingBusy`` is raised so a burst of logins is turned away early
+rather than piling up and starving other traffic.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
+
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 32))
+
+# Argon2 cost profile. Changing it only affects new hashes; existing ones
+# keep verifying with the parameters stored in them.
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", 3))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", 65536))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", 4))
+
+# Number of recent hashes the latency averages cover.
+METRICS_WINDOW = 200
+
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__rounds=ARGON2_TIME_COST,
+    argon2__memory_cost=ARGON2_MEMORY_COST,
+    argon2__parallelism=ARGON2_PARALLELISM,
+)
+
+
+class PasswordHashingBusy(Exception):
+    """Too many password hashes are already queued."""
+
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_lock = threading.Lock()
+_pending = 0
+_running = 0
+_stats = {"completed": 0, "rejected": 0}
+_recent = deque(maxlen=METRICS_WINDOW)  # (queue wait, hash time)
+
+
+def truncate_password(password: str) -> str:
+    """Cut the password to 72 bytes without splitting a UTF-8 character"""
+    password_bytes = password.encode('utf-8')
+    if len(password_bytes) > 72:
+        truncated_bytes = password_bytes[:72]
+        while truncated_bytes:
+            try:
+                return truncated_bytes.decode('utf-8')
+            except UnicodeDecodeError:
+                truncated_bytes = truncated_bytes[:-1]
+    return password
+
+
+def _timed(func, args, enqueued_at):
+    global _running
+    started = time.monotonic()
+    with _lock:
+        _running += 1
+    try:
+        return func(*args)
+    finally:
+        finished = time.monotonic()
+        with _lock:
+            _running -= 1
+            _stats["completed"] += 1
+            _recent.append((started - enqueued_at, finished - started))
+
+
+def _release(future):
+    global _pending
+    with _lock:
+        _pending -= 1
+
+
+def _submit(func, *args):
+    global _pending
+    with _lock:
+        if _pending >= PASSWORD_HASH_MAX_PENDING:
+            _stats["rejected"] += 1
+            raise PasswordHashingBusy("Too many login requests, try again shortly")
+        _pending += 1
+    try:
+        future = _executor.submit(_timed, func, args, time.monotonic())
+    except BaseException:
+        _release(None)
+        raise
+    future.add_done_callback(_release)
+    return future
+
+
+def hash_password(password: str) -> str:
+    return _submit(pwd_context.hash, truncate_password(password)).result()
+
+
+def verify_password(password: str, hashed_password: str) -> bool:
+    return _submit(pwd_context.verify, truncate_password(password), hashed_password).result()
+
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.wrap_future(_submit(pwd_context.hash, truncate_password(password)))
+
+
+async def verify_password_async(password: str, hashed_password: str) -> bool:
+    return await asyncio.wrap_future(
+        _submit(pwd_context.verify, truncate_password(password), hashed_password)
+    )
+
+
+def _average(values):
+    values = list(values)
+    return round(sum(values) / len(values), 6) if values else None
+
+
+def get_hashing_metrics():
+    """Queue depth and latency of password hashing"""
+    with _lock:
+        recent = list(_recent)
+        return {
+            "workers": PASSWORD_HASH_WORKERS,
+            "max_pending": PASSWORD_HASH_MAX_PENDING,
+            "queue_depth": _pending - _running,
+            "running": _running,
+            "completed": _stats["completed"],
+            "rejected": _stats["rejected"],
+            "avg_queue_wait": _average(wait for wait, _ in recent),
+            "avg_hash_time": _average(hashing for _, hashing in recent),
+            "max_hash_time": round(max((hashing for _, hashing in recent), default=0.0), 6),
+            "cost": {
+                "time_cost": ARGON2_TIME_COST,
+                "memory_cost": ARGON2_MEMORY_COST,
+                "parallelism": ARGON2_PARALLELISM,
+            },
+        }
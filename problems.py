@@ -0,0 +1,98 @@
+"""In-memory catalog of the problems defined in ``test_cases/``.
+
+Every ``<problem_id>.json`` file is parsed once and kept in memory. Lookups
+re-check the directory at most once per ``check_interval`` seconds and reload
+only the files whose mtime or size changed, so edits to ``test_cases/`` are
+picked up without a restart while most requests never touch the disk.
+
+Each problem also has a content hash (sha256 of its file) that identifies
+the exact set of tests, e.g. for caching grading results.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+TEST_CASES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_cases")
+
+
+class ProblemRegistry:
+    def __init__(self, directory: str = TEST_CASES_DIR, check_interval: float = 1.0):
+        self.directory = directory
+        self.check_interval = check_interval
+        # Bumped whenever a problem is added, changed or removed.
+        self.version = 0
+        self._problems = {}
+        self._hashes = {}
+        self._stats = {}
+        self._last_check = None
+        self._lock = threading.Lock()
+
+    def _scan(self):
+        stats = {}
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            entries = []
+        for entry in entries:
+            if entry.name.endswith(".json") and entry.is_file():
+                st = entry.stat()
+                stats[entry.name[:-len(".json")]] = (st.st_mtime_ns, st.st_size)
+        return stats
+
+    def _load_file(self, problem_id: str):
+        """Return ``(data, content_hash)``, or None for a missing or invalid file."""
+        try:
+            with open(os.path.join(self.directory, f"{problem_id}.json"), "rb") as f:
+                raw = f.read()
+            data = json.loads(raw)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or ("public_tests" not in data and "hidden_tests" not in data):
+            return None
+        return data, hashlib.sha256(raw).hexdigest()
+
+    def refresh(self, force: bool = False):
+        """Reload problems whose files changed since the last check."""
+        now = time.monotonic()
+        if not force and self._last_check is not None and now - self._last_check < self.check_interval:
+            return
+        with self._lock:
+            if not force and self._last_check is not None and now - self._last_check < self.check_interval:
+                return
+            stats = self._scan()
+            if stats != self._stats:
+                problems, hashes = {}, {}
+                for problem_id, stat in stats.items():
+                    if self._stats.get(problem_id) == stat and problem_id in self._problems:
+                        problems[problem_id] = self._problems[problem_id]
+                        hashes[problem_id] = self._hashes[problem_id]
+                        continue
+                    loaded = self._load_file(problem_id)
+                    if loaded is not None:
+                        problems[problem_id], hashes[problem_id] = loaded
+                self._problems = dict(sorted(problems.items()))
+                self._hashes = hashes
+                self._stats = stats
+                self.version += 1
+            self._last_check = time.monotonic()
+
+    def get(self, problem_id: str):
+        """Return the parsed test file of ``problem_id``, or None."""
+        self.refresh()
+        return self._problems.get(problem_id)
+
+    def get_with_hash(self, problem_id: str):
+        """Return ``(data, content_hash)`` for ``problem_id`` from the same load, or ``(None, None)``."""
+        self.refresh()
+        with self._lock:
+            return self._problems.get(problem_id), self._hashes.get(problem_id)
+
+    def ids(self):
+        """Return the ids of all problems, sorted."""
+        self.refresh()
+        return list(self._problems)
+
+
+problem_registry = ProblemRegistry()
@@ -0,0 +1,116 @@
+"""Cache of grading results for identical submissions.
+
+A result is keyed by the hash of the normalized source code, the content
+hash of the problem's test file and the grading policy (failure limit, time and memory
+limits). Editing ``test_cases/<id>.json`` changes its content hash, so
+stale results are never looked up again and age out of the LRU.
+
+Entries live in memory, bounded by count and by approximate size, and are
+optionally written to ``GRADER_CACHE_DIR`` so they survive restarts and are
+shared by every worker on the host. Only deterministic outcomes are stored:
+a result with a timeout or an execution error is never cached.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+def normalize_code(code: str) -> str:
+    """Drop differences that cannot change behaviour: line endings and
+    trailing blank lines. Other whitespace can be part of a string literal
+    or a line continuation, and leading lines shift traceback line numbers,
+    so both are kept."""
+    lines = code.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    while lines and not lines[-1].strip():
+        lines.pop()
+    return "\n".join(lines)
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 64 * 1024 * 1024, directory: str = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._entries = OrderedDict()  # key -> (result, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(code: str, problem_hash: str, policy) -> str:
+        code_hash = hashlib.sha256(normalize_code(code).encode("utf-8")).hexdigest()
+        raw = json.dumps([code_hash, problem_hash, policy], sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key: str):
+        """Return the cached result for ``key``, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return entry[0]
+        if self.directory:
+            try:
+                with open(self._path(key), "r") as f:
+                    encoded = f.read()
+                result = json.loads(encoded)
+            except (OSError, ValueError):
+                pass
+            else:
+                with self._lock:
+                    self._stats["disk_hits"] += 1
+                    self._insert(key, result, len(encoded))
+                return result
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, key: str, result: dict):
+        encoded = json.dumps(result, default=str)
+        with self._lock:
+            self._stats["stores"] += 1
+            self._insert(key, json.loads(encoded), len(encoded))
+        if self.directory:
+            path = self._path(key)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(tmp_path, "w") as f:
+                    f.write(encoded)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Warning: Failed to write grading cache entry: {e}")
+
+    def _insert(self, key: str, result: dict, size: int):
+        if size > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous[1]
+        self._entries[key] = (result, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self._stats["evictions"] += 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["disk_hits"] + self._stats["misses"]
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "directory": self.directory,
+                **self._stats,
+                "hit_rate": round((self._stats["hits"] + self._stats["disk_hits"]) / lookups, 3) if lookups else None,
+            }
@@ -0,0 +1,284 @@
+"""Resource limits and accounting for running submissions.
+
+Every test case runs with a CPU-time limit, an address-space limit
+(``RLIMIT_AS``) and a process limit (``RLIMIT_NPROC``), and reports the CPU
+time, peak resident memory and wall time it used. Running out of CPU time is
+a time limit exceeded; producing no result within the (longer) wall-clock
+limit is a stall - a sleeping or blocked solution, or one starved of CPU on a
+busy host - and is reported separately, so several jobs can share a core
+without turning slow neighbours into wrong verdicts.
+
+``RLIMIT_NPROC`` counts every process of the OS user, so a limit of ``0``
+means "no new processes or threads"; it is not enforced for root.
+"""
+import builtins
+import io
+import math
+import os
+import resource
+import select
+import signal
+import subprocess
+import sys
+import time
+import traceback
+
+
+class CaseResult(subprocess.CompletedProcess):
+    """A ``CompletedProcess`` that also carries the resources the run used."""
+
+    def __init__(self, args, returncode, stdout=None, stderr=None, usage=None):
+        super().__init__(args, returncode, stdout, stderr)
+        self.usage = usage
+
+
+class WallTimeExceeded(subprocess.TimeoutExpired):
+    """No result within the wall-clock limit."""
+
+    def __init__(self, cmd, timeout, usage=None):
+        super().__init__(cmd, timeout)
+        self.usage = usage
+
+
+class CpuTimeExceeded(subprocess.SubprocessError):
+    """The run used more CPU time than its limit."""
+
+    def __init__(self, cmd, cpu_limit, usage=None):
+        self.cmd = cmd
+        self.cpu_limit = cpu_limit
+        self.usage = usage
+
+    def __str__(self):
+        return f"Command '{self.cmd}' exceeded {self.cpu_limit} seconds of CPU time"
+
+
+def make_usage(wall: float, cpu: float = None, memory_kb: int = None, memory_exceeded: bool = False) -> dict:
+    """Per-test resource record; times are given in seconds and stored in milliseconds."""
+    return {
+        "wall_ms": round(wall * 1000, 3),
+        "cpu_ms": round(cpu * 1000, 3) if cpu is not None else None,
+        "memory_kb": memory_kb,
+        "memory_exceeded": memory_exceeded,
+    }
+
+
+def _rlimits(cpu_seconds: float = None, memory_mb: int = None, max_processes: int = None) -> list:
+    """``(resource, soft, hard)`` for each limit that is set.
+
+    The CPU limit delivers SIGXCPU once it is used up and SIGKILL a second
+    later, should the process survive that.
+    """
+    limits = []
+    if cpu_seconds is not None:
+        soft = max(1, math.ceil(cpu_seconds))
+        limits.append((resource.RLIMIT_CPU, soft, soft + 1))
+    if memory_mb:
+        limit = memory_mb * 1024 * 1024
+        limits.append((resource.RLIMIT_AS, limit, limit))
+    if max_processes is not None:
+        limits.append((resource.RLIMIT_NPROC, max_processes, max_processes))
+    return limits
+
+
+def set_limits(cpu_seconds: float = None, memory_mb: int = None, max_processes: int = None):
+    """Apply limits to the calling process; None leaves a limit unchanged."""
+    for which, soft, hard in _rlimits(cpu_seconds, memory_mb, max_processes):
+        resource.setrlimit(which, (soft, hard))
+
+
+def set_memory_limit(memory_mb: int = None):
+    """Set only the soft address-space limit (``None`` or 0: back to the hard
+    limit), so a long-lived worker can change it from one job to the next."""
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    soft = memory_mb * 1024 * 1024 if memory_mb else hard
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+
+
+# Run as ``python -I -S -c EXEC_SHIM <which:soft:hard,...> <command...>``:
+# applies the limits to itself, then execs the command in the same process.
+EXEC_SHIM = (
+    "import os, resource, sys\n"
+    "for limit in filter(None, sys.argv[1].split(',')):\n"
+    "    which, soft, hard = map(int, limit.split(':'))\n"
+    "    resource.setrlimit(which, (soft, hard))\n"
+    "os.execvp(sys.argv[2], sys.argv[2:])\n"
+)
+
+
+def limited_command(args: list, cpu_seconds: float = None, memory_mb: int = None,
+                    max_processes: int = None) -> list:
+    """``args`` prefixed with a small exec wrapper that applies the limits first.
+
+    Unlike a ``preexec_fn`` this is safe to start from a threaded process and
+    leaves ``subprocess`` free to use vfork/posix_spawn. The exec keeps the pid,
+    so ``os.wait4`` still accounts for the whole run.
+    """
+    limits = _rlimits(cpu_seconds, memory_mb, max_processes)
+    if not limits:
+        return list(args)
+    spec = ",".join(f"{which}:{soft}:{hard}" for which, soft, hard in limits)
+    return [sys.executable, "-I", "-S", "-c", EXEC_SHIM, spec, *args]
+
+
+def snapshot_interpreter():
+    """Copy the interpreter state a submission run in-process could leave
+    changed for the next one: the ``builtins`` namespace and ``sys.modules``."""
+    return dict(builtins.__dict__), dict(sys.modules)
+
+
+def restore_interpreter(snapshot):
+    """Undo additions, removals and replacements made since ``snapshot_interpreter``."""
+    for current, saved in zip((builtins.__dict__, sys.modules), snapshot):
+        for name in [name for name in current if name not in saved]:
+            del current[name]
+        for name, value in saved.items():
+            if current.get(name) is not value:
+                current[name] = value
+
+
+class _CaseTimeout(BaseException):
+    pass
+
+
+class _CpuTimeout(BaseException):
+    pass
+
+
+def _on_alarm(signum, frame):
+    raise _CaseTimeout()
+
+
+def _on_cpu_limit(signum, frame):
+    raise _CpuTimeout()
+
+
+def install_case_timers():
+    """Turn SIGALRM and SIGPROF into the timeouts ``run_in_process`` reports."""
+    signal.signal(signal.SIGALRM, _on_alarm)
+    signal.signal(signal.SIGPROF, _on_cpu_limit)
+
+
+def run_in_process(code, stdin_data: str, timeout: float = None, cpu_limit: float = None,
+                   memory_mb: int = None) -> dict:
+    """Execute a submission in a fresh ``__main__`` namespace of this process.
+
+    ``code`` is the source or a compiled code object (which should call
+    ``solve()`` itself). ``sys.stdin``/``sys.stdout``/``sys.stderr`` are
+    swapped for the run; ``timeout`` (wall) and ``cpu_limit`` are enforced
+    with interval timers, which need ``install_case_timers``, and
+    ``memory_mb`` lowers the soft address-space limit. Changes to
+    ``builtins`` and ``sys.modules`` are undone afterwards. Returns a record
+    with the return code, output, which limit was hit, and the wall time, CPU
+    time and peak memory used.
+    """
+    stdout, stderr = io.StringIO(), io.StringIO()
+    measure_memory = reset_peak_memory()
+    interpreter = snapshot_interpreter()
+    recursion_limit = sys.getrecursionlimit()
+    set_memory_limit(memory_mb)
+    sys.stdin, sys.stdout, sys.stderr = io.StringIO(stdin_data), stdout, stderr
+    returncode = 0
+    timed_out = cpu_exceeded = memory_exceeded = False
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    if timeout:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    if cpu_limit:
+        signal.setitimer(signal.ITIMER_PROF, cpu_limit)
+    try:
+        if isinstance(code, str):
+            code = compile(code, "<submission>", "exec")
+        exec(code, {"__name__": "__main__", "__builtins__": builtins})
+    except _CaseTimeout:
+        timed_out = True
+    except _CpuTimeout:
+        cpu_exceeded = True
+    except MemoryError as e:
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        returncode = 1
+        memory_exceeded = True
+    except SystemExit as e:
+        if e.code is None:
+            returncode = 0
+        elif isinstance(e.code, int):
+            returncode = e.code
+        else:
+            print(e.code, file=stderr)
+            returncode = 1
+    except BaseException as e:
+        # Drop this frame so the traceback starts in the submission.
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+        returncode = 1
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        restore_interpreter(interpreter)
+        sys.stdin, sys.stdout, sys.stderr = sys.__stdin__, sys.__stdout__, sys.__stderr__
+        sys.setrecursionlimit(recursion_limit)
+    return {
+        "returncode": returncode,
+        "stdout": stdout.getvalue(),
+        "stderr": stderr.getvalue(),
+        "timed_out": timed_out,
+        "cpu_exceeded": cpu_exceeded,
+        "memory_exceeded": memory_exceeded,
+        "elapsed": round(time.perf_counter() - start, 6),
+        "cpu": round(time.process_time() - cpu_start, 6),
+        "memory_kb": peak_memory_kb() if measure_memory else None,
+    }
+
+
+def rusage_cpu(rusage) -> float:
+    return rusage.ru_utime + rusage.ru_stime
+
+
+def out_of_memory(returncode: int, stderr: str) -> bool:
+    """Whether a Python process failed because it could not allocate memory."""
+    if returncode == 0 or not stderr:
+        return False
+    lines = stderr.strip().splitlines()
+    return bool(lines) and lines[-1].startswith("MemoryError")
+
+
+def reset_peak_memory() -> bool:
+    """Restart this process's peak-RSS measurement. False where unsupported."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_memory_kb():
+    """Peak resident memory of this process since the last reset, in KiB."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def wait_exit(pid: int, timeout: float) -> bool:
+    """Wait up to ``timeout`` seconds for the child ``pid`` to exit, without reaping it."""
+    try:
+        fd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        # No pidfd (older kernel, non-Linux): poll instead.
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if os.waitid(os.P_PID, pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None:
+                return True
+            time.sleep(min(0.005, max(0, deadline - time.monotonic())))
+        return os.waitid(os.P_PID, pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None
+    try:
+        poller = select.poll()
+        poller.register(fd, select.POLLIN)
+        return bool(poller.poll(max(0, timeout) * 1000))
+    finally:
+        os.close(fd)
@@ -1,18 +1,29 @@
-from fastapi import FastAPI, HTTPException
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
+from typing import Optional
+import asyncio
+import functools
+import hashlib
 import os
 import json
 import subprocess
-import tempfile
+import threading
 import time
-import uuid
+
+from auth import create_access_token, enforce_rate_limit, get_current_user
 
 # Try to import database functions, falling back gracefully if not available.
 try:
-    from database import init_db, create_user, verify_user
+    from database_async import (
+        init_db, create_user, verify_user, get_pool_stats, close_pool, save_attempt, get_submission_history,
+        parse_history_cursor
+    )
+    from password_hashing import PasswordHashingBusy, get_hashing_metrics
     DATABASE_AVAILABLE = True
     print("✓ Database module imported successfully")
 except ImportError as e:
@@ -20,7 +31,14 @@ except ImportError as e:
     print(f"⚠ Warning: Database module not available - {e}")
     print("⚠ Authentication will not work.")
 
-from grader import grade_submission
+from grader import (
+    grade_submission, run_case, problem_limits, stage_code, GRADER_BACKEND, get_worker_pool,
+    shutdown_worker_pool, get_result_cache, single_flight_metrics, limit_errors
+)
+from leaderboard import Leaderboard, LeaderboardLog, SqliteLeaderboard
+from problems import problem_registry
+from sandbox import CpuTimeExceeded
+from submission_queue import create_submission_queue
 
 app = FastAPI()
 
@@ -35,32 +53,106 @@ app.add_middleware(
 
 print("✓ CORS middleware configured")
 
-# Load existing submissions from a JSON file.
+# Grading blocks on child processes, so it runs on a dedicated executor instead
+# of the event loop. The semaphore bounds how many /api/run and /api/submit
+# requests are being judged at once; the rest wait without holding a thread.
+GRADING_CONCURRENCY = int(os.environ.get("GRADING_CONCURRENCY", 4))
+grading_executor = ThreadPoolExecutor(max_workers=GRADING_CONCURRENCY, thread_name_prefix="grading")
+grading_semaphore = asyncio.Semaphore(GRADING_CONCURRENCY)
+
+async def run_grading(func, *args, **kwargs):
+    """Run a blocking grading call on the grading executor."""
+    async with grading_semaphore:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(grading_executor, functools.partial(func, *args, **kwargs))
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a short blocking call, such as a leaderboard write, off the event loop.
+
+    Uses the default executor so it never waits behind a grading job.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+# Load existing submissions: the leaderboard.json snapshot plus the
+# append-only leaderboard.log of entries accepted since it was written.
+# That pair belongs to a single process; with several uvicorn workers set
+# LEADERBOARD_BACKEND=sqlite so all of them share one database (seeded from
+# leaderboard.json the first time).
+LEADERBOARD_BACKEND = os.environ.get("LEADERBOARD_BACKEND", "file")
 leaderboard_file = "leaderboard.json"
-if os.path.exists(leaderboard_file):
-    with open(leaderboard_file, "r") as f:
-        submissions = json.load(f)
+leaderboard_log = LeaderboardLog(
+    leaderboard_file,
+    fsync_interval=float(os.environ.get("LEADERBOARD_FSYNC_INTERVAL", 0.05)),
+    compact_every=int(os.environ.get("LEADERBOARD_COMPACT_EVERY", 1000))
+)
+if LEADERBOARD_BACKEND == "sqlite":
+    leaderboard = SqliteLeaderboard(
+        os.environ.get("LEADERBOARD_DB", "leaderboard.db"), seed_entries=leaderboard_log.load()
+    )
+    leaderboard_log = None
 else:
-    submissions = []
+    leaderboard = Leaderboard(leaderboard_log.load())
+    leaderboard_log.open(leaderboard.entries)
+leaderboard_lock = threading.Lock()
+
+# With SUBMISSION_QUEUE set to "memory" or "sqlite", /api/submit enqueues the
+# submission and returns its id; queue worker threads grade it and clients poll
+# /api/submission/{id}. The sqlite queue is shared by all workers on the host.
+SUBMISSION_QUEUE = os.environ.get("SUBMISSION_QUEUE", "")
+SUBMISSION_QUEUE_WORKERS = int(os.environ.get("SUBMISSION_QUEUE_WORKERS", GRADING_CONCURRENCY))
+submission_queue = create_submission_queue(
+    SUBMISSION_QUEUE, os.environ.get("SUBMISSION_QUEUE_DB", "submission_queue.db")
+) if SUBMISSION_QUEUE else None
+
+# Set once init_db succeeds; graded attempts are only recorded after that.
+database_ready = False
+# The server's event loop, for scheduling database writes from grading threads.
+main_loop = None
 
 # Initialize the database on application startup.
 @app.on_event("startup")
 async def startup():
+    global database_ready, main_loop
     print("🚀 Starting server...")
+    main_loop = asyncio.get_running_loop()
+    problem_registry.refresh(force=True)
+    print(f"✓ Loaded {len(problem_registry.ids())} problems")
     if DATABASE_AVAILABLE:
         try:
-            init_db()
+            await init_db()
+            database_ready = True
             print("✓ Database initialized successfully")
         except Exception as e:
             print(f"✗ Database initialization failed: {e}")
     else:
         print("⚠ Running without database support")
+    if GRADER_BACKEND == "pool":
+        get_worker_pool()
+        print("✓ Grader worker pool started")
+    if submission_queue is not None:
+        submission_queue.start(_grade_and_record, SUBMISSION_QUEUE_WORKERS)
+        print(f"✓ Submission queue started ({SUBMISSION_QUEUE}, {SUBMISSION_QUEUE_WORKERS} workers)")
+
+@app.on_event("shutdown")
+async def shutdown():
+    if submission_queue is not None:
+        submission_queue.stop()
+    grading_executor.shutdown(wait=False)
+    shutdown_worker_pool()
+    if leaderboard_log is not None:
+        leaderboard_log.close()
+    if DATABASE_AVAILABLE:
+        await close_pool()
 
 # --- Pydantic Models for API Request Body Validation ---
 class Submission(BaseModel):
     user_id: str
     problem_id: str
     code: str
+    # Stop grading after the first failure / after this many failures.
+    fail_fast: bool = False
+    max_failures: Optional[int] = Field(None, ge=1)
 
 class SignupRequest(BaseModel):
     username: str
@@ -71,6 +163,29 @@ class LoginRequest(BaseModel):
     username: str
     password: str
     
+# --- Pre-encoded responses ---
+# Read endpoints whose body only changes with a version number (the problem
+# registry's or the leaderboard's) are encoded once per version and served
+# with a strong ETag, answering matching If-None-Match requests with 304.
+_encoded_responses = {}
+
+def cached_json_response(request: Request, key, version, build):
+    """Return ``build()`` as JSON, re-encoding it only when ``version`` changes."""
+    cached = _encoded_responses.get(key)
+    if cached is None or cached[0] != version:
+        body = json.dumps(build(), default=str, separators=(",", ":")).encode("utf-8")
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        cached = (version, body, etag)
+        _encoded_responses[key] = cached
+    _, body, etag = cached
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        if etag in tags or "*" in tags:
+            return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 # --- API Endpoints ---
 # All API endpoints are prefixed with '/api' to avoid conflicts with frontend paths.
 
@@ -83,16 +198,32 @@ async def root_api():
         "database_available": DATABASE_AVAILABLE
     }
 
+@app.get("/api/db/pool")
+def db_pool_stats_api():
+    """Database connection pool metrics."""
+    if not DATABASE_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Database service unavailable.")
+    return get_pool_stats()
+
+@app.get("/api/auth/hashing")
+def hashing_metrics_api():
+    """Password hashing queue depth and latency."""
+    if not DATABASE_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Database service unavailable.")
+    return get_hashing_metrics()
+
 @app.post("/api/signup")
 async def signup_api(request: SignupRequest):
     """User signup endpoint."""
     if not DATABASE_AVAILABLE:
         raise HTTPException(status_code=503, detail="Database service unavailable.")
     try:
-        result = create_user(request.username, request.email, request.password)
+        result = await create_user(request.username, request.email, request.password)
         if not result["success"]:
             raise HTTPException(status_code=400, detail=result["error"])
         return result
+    except PasswordHashingBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -102,96 +233,215 @@ async def login_api(request: LoginRequest):
     if not DATABASE_AVAILABLE:
         raise HTTPException(status_code=503, detail="Database service unavailable")
     try:
-        result = verify_user(request.username, request.password)
+        result = await verify_user(request.username, request.password)
         if not result["success"]:
             raise HTTPException(status_code=401, detail=result["error"])
+        result.update(create_access_token(result["user_id"], result["username"]))
         return result
+    except PasswordHashingBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/problems")
-def list_problems_api():
+def list_problems_api(request: Request):
     """List all available problems from test cases."""
-    problems = []
-    test_cases_dir = "test_cases"
-    if not os.path.exists(test_cases_dir):
-        return {"problems": []}
-    for file in os.listdir(test_cases_dir):
-        if file.endswith(".json"):
-            try:
-                with open(os.path.join(test_cases_dir, file), "r") as f:
-                    data = json.load(f)
-                if "public_tests" in data or "hidden_tests" in data:
-                    problems.append(file.replace(".json", ""))
-            except Exception:
-                continue
-    return {"problems": problems}
+    problem_registry.refresh()
+    return cached_json_response(
+        request, "problems", problem_registry.version,
+        lambda: {"problems": problem_registry.ids()}
+    )
 
 @app.get("/api/problem/{problem_id}")
-def get_problem_details_api(problem_id: str):
+def get_problem_details_api(problem_id: str, request: Request):
     """Get detailed information about a specific problem."""
-    try:
-        test_case_path = os.path.join("test_cases", f"{problem_id}.json")
-        if not os.path.exists(test_case_path):
-            raise HTTPException(status_code=404, detail="Problem not found")
-        with open(test_case_path, "r") as f:
-            problem_data = json.load(f)
-        return {
-            "problem_id": problem_id,
-            "public_tests": problem_data.get("public_tests", []),
-            "hidden_tests_count": len(problem_data.get("hidden_tests", [])),
-            "total_tests": len(problem_data.get("public_tests", [])) + len(problem_data.get("hidden_tests", []))
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error loading problem: {str(e)}")
+    problem_data = problem_registry.get(problem_id)
+    if problem_data is None:
+        raise HTTPException(status_code=404, detail="Problem not found")
+    return cached_json_response(request, ("problem", problem_id), problem_registry.version, lambda: {
+        "problem_id": problem_id,
+        "public_tests": problem_data.get("public_tests", []),
+        "hidden_tests_count": len(problem_data.get("hidden_tests", [])),
+        "total_tests": len(problem_data.get("public_tests", [])) + len(problem_data.get("hidden_tests", [])),
+        **problem_limits(problem_data)
+    })
 
-@app.post("/api/submit")
-async def submit_code_api(submission: Submission):
-    """Submit code for grading and update leaderboard."""
-    test_case_path = os.path.join("test_cases", f"{submission.problem_id}.json")
-    if not os.path.exists(test_case_path):
-        raise HTTPException(status_code=404, detail="Problem test cases not found")
+def _attempt_saved(future):
     try:
-        result = grade_submission(
-            code=submission.code,
-            problem_id=submission.problem_id,
-            user_id=submission.user_id
-        )
+        saved = future.result()
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Grading failed: {str(e)}")
+        saved = {"success": False, "error": str(e)}
+    if not saved["success"]:
+        print(f"Warning: Failed to save submission history: {saved['error']}")
+
+def _record_attempt(submission_entry: dict, result: dict):
+    """Add a graded attempt to the submission history without waiting for the write.
+
+    It shares the id and timestamp of ``submission_entry``, the leaderboard entry
+    returned to the client.
+    """
+    if not database_ready:
+        return
+    attempt = {
+        "submission_id": submission_entry["submission_id"],
+        "user_id": submission_entry["user_id"],
+        "problem_id": submission_entry["problem_id"],
+        "score": result["score"],
+        "total": result["total"],
+        "replay_result": result["replay_result"],
+        "code_hash": result["code_hash"],
+        "timestamp": submission_entry["timestamp"],
+        "results": result["test_results"]
+    }
+    asyncio.run_coroutine_threadsafe(save_attempt(attempt), main_loop).add_done_callback(_attempt_saved)
 
+def record_submission(user_id: str, problem_id: str, result: dict):
+    """Add a graded submission to the leaderboard and build the /api/submit response."""
     submission_entry = {
-        "submission_id": str(uuid.uuid4()),
-        "user_id": submission.user_id,
-        "problem_id": submission.problem_id,
+        "submission_id": result["submission_entry"]["submission_id"],
+        "user_id": user_id,
+        "problem_id": problem_id,
         "score": result["score"],
         "replay_result": f"{result['score']}/{result['total']} tests passed",
         "timestamp": datetime.now().isoformat(),
         "error_details": result.get("error_details", [])
     }
-    global submissions
-    existing_index = next((i for i, entry in enumerate(submissions)
-                           if entry["user_id"] == submission.user_id and entry["problem_id"] == submission.problem_id), None)
-    if existing_index is not None:
-        if submission_entry["score"] > submissions[existing_index]["score"]:
-            submissions[existing_index] = submission_entry
-    else:
-        submissions.append(submission_entry)
-    try:
-        with open(leaderboard_file, "w") as f:
-            json.dump(submissions, f, indent=2, default=str)
-    except Exception as e:
-        print(f"Warning: Failed to save leaderboard: {e}")
+    with leaderboard_lock:
+        if leaderboard.submit(submission_entry) and leaderboard_log is not None:
+            try:
+                leaderboard_log.append(submission_entry)
+            except Exception as e:
+                print(f"Warning: Failed to save leaderboard: {e}")
+    _record_attempt(submission_entry, result)
     return {
         "grade": {
             "score": result["score"],
             "total": result["total"],
+            "skipped": result["skipped"],
             "replay_result": result["replay_result"],
-            "error_details": result.get("error_details", [])[:3]
+            "error_details": limit_errors(result.get("error_details", []), 3, result["skipped"]),
+            "cached": result.get("cached", False),
+            "joined": result.get("joined", False)
         },
         "leaderboard_entry": submission_entry
     }
 
+def _grade_and_record(payload: dict):
+    """Grade a queued submission and record it on the leaderboard."""
+    result = grade_submission(
+        code=payload["code"],
+        problem_id=payload["problem_id"],
+        user_id=payload["user_id"],
+        fail_fast=payload.get("fail_fast", False),
+        max_failures=payload.get("max_failures")
+    )
+    return record_submission(payload["user_id"], payload["problem_id"], result)
+
+@app.post("/api/submit")
+async def submit_code_api(submission: Submission, request: Request, user: Optional[dict] = Depends(get_current_user)):
+    """Submit code for grading and update leaderboard."""
+    enforce_rate_limit(request, user)
+    if user is not None:
+        submission.user_id = user["sub"]
+    if problem_registry.get(submission.problem_id) is None:
+        raise HTTPException(status_code=404, detail="Problem test cases not found")
+    if submission_queue is not None:
+        submission_id = await run_blocking(submission_queue.enqueue, submission.model_dump())
+        return JSONResponse(status_code=202, content={"submission_id": submission_id, "status": "queued"})
+    try:
+        result = await run_grading(
+            grade_submission,
+            code=submission.code,
+            problem_id=submission.problem_id,
+            user_id=submission.user_id,
+            fail_fast=submission.fail_fast,
+            max_failures=submission.max_failures
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Grading failed: {str(e)}")
+
+    return await run_blocking(record_submission, submission.user_id, submission.problem_id, result)
+
+@app.post("/api/submit/stream")
+async def submit_code_stream_api(submission: Submission, request: Request, user: Optional[dict] = Depends(get_current_user)):
+    """Submit code for grading, streaming each test result as a Server-Sent Event.
+
+    Emits one ``test`` event per checked test, then a ``done`` event carrying
+    the same body /api/submit returns (or an ``error`` event).
+    """
+    enforce_rate_limit(request, user)
+    if user is not None:
+        submission.user_id = user["sub"]
+    if problem_registry.get(submission.problem_id) is None:
+        raise HTTPException(status_code=404, detail="Problem test cases not found")
+    if submission_queue is not None:
+        submission_id = await run_blocking(submission_queue.enqueue, submission.model_dump())
+        return JSONResponse(status_code=202, content={"submission_id": submission_id, "status": "queued"})
+
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+
+    def on_result(test):
+        loop.call_soon_threadsafe(events.put_nowait, ("test", test))
+
+    async def grade():
+        try:
+            result = await run_grading(
+                grade_submission,
+                code=submission.code,
+                problem_id=submission.problem_id,
+                user_id=submission.user_id,
+                fail_fast=submission.fail_fast,
+                max_failures=submission.max_failures,
+                on_result=on_result
+            )
+            response = await run_blocking(record_submission, submission.user_id, submission.problem_id, result)
+            await events.put(("done", response))
+        except Exception as e:
+            await events.put(("error", {"detail": f"Grading failed: {str(e)}"}))
+
+    task = asyncio.create_task(grade())
+
+    async def stream():
+        while True:
+            event, data = await events.get()
+            yield f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+            if event != "test":
+                break
+        await task
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/submission/{submission_id}")
+def get_submission_api(submission_id: str):
+    """Get the status and, once graded, the result of a queued submission."""
+    if submission_queue is None:
+        raise HTTPException(status_code=404, detail="Submission queue is not enabled")
+    job = submission_queue.get(submission_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Submission not found")
+    return job
+
+@app.get("/api/queue/metrics")
+def get_queue_metrics_api():
+    """Queue depth, wait time and grading time of the submission queue."""
+    if submission_queue is None:
+        return {"enabled": False}
+    return {"enabled": True, "workers": SUBMISSION_QUEUE_WORKERS, **submission_queue.metrics()}
+
+@app.get("/api/grader/cache")
+def get_grader_cache_api():
+    """Hit rate and size of the grading result cache, and shared in-flight gradings."""
+    cache = get_result_cache()
+    return {
+        "cache": {"enabled": True, **cache.metrics()} if cache is not None else {"enabled": False},
+        "single_flight": single_flight_metrics()
+    }
+
 # @app.post("/api/run")
 # async def run_code_api(request: dict):
 #     """Run code without grading."""
@@ -255,72 +505,45 @@ async def submit_code_api(submission: Submission):
 #     except Exception as e:
 #         return {"success": False, "error": f"Execution error: {str(e)}"}
 
-@app.post("/api/run")
-async def run_code_api(request: dict):
-    """Run code with multiple public test cases without grading."""
-    try:
-        problem_id = request.get("problem_id")
-        code = request.get("code")
-        
-        if not problem_id or not code:
-            return {"success": False, "error": "Missing problem_id or code"}
-        
-        # Load test cases
-        test_case_path = os.path.join("test_cases", f"{problem_id}.json")
-        
-        if not os.path.exists(test_case_path):
-            return {"success": False, "error": "Test cases not found"}
-        
-        with open(test_case_path, "r") as f:
-            test_data = json.load(f)
-        
-        # Get all public test cases (limit to 4)
-        public_tests = test_data.get("public_tests", [])[:4]
-        
-        if not public_tests:
-            return {"success": False, "error": "No public test cases available"}
-        
-        # Run code against all public test cases
-        results = []
-        
+def _run_public_tests(problem_id: str, code: str):
+    """Run code against a problem's public test cases. Blocks until done."""
+    test_data = problem_registry.get(problem_id)
+    if test_data is None:
+        return {"success": False, "error": "Test cases not found"}
+
+    # Get all public test cases (limit to 4)
+    public_tests = test_data.get("public_tests", [])[:4]
+
+    if not public_tests:
+        return {"success": False, "error": "No public test cases available"}
+
+    # Run code against all public test cases
+    results = []
+
+    # The code is staged once and run against every test.
+    with stage_code(code) as script:
         for idx, test_case in enumerate(public_tests):
             test_input = test_case.get("input", "")
             expected_output = test_case.get("expected_output", "").strip()
-            
-            tmp_file = None
+            limits = problem_limits(test_data, test_case)
+            time_limit = limits["time_limit_ms"] / 1000
+
             try:
-                # Create temporary file with the code
-                with tempfile.NamedTemporaryFile(mode='w+', suffix='.py', delete=False) as tmp:
-                    tmp_file = tmp.name
-                    tmp.write(code + "\n")
-                    tmp.write(f"""
-if __name__ == "__main__":
-    import sys
-    from io import StringIO
-    
-    input_data = '''{test_input}'''
-    sys.stdin = StringIO(input_data)
-    
-    solve()
-""")
-                    tmp.flush()
-                
-                # Run the code
                 start_time = time.time()
-                result = subprocess.run(
-                    ["python", tmp_file],
-                    capture_output=True,
-                    text=True,
-                    timeout=5
-                )
+                result = run_case(code, test_input, time_limit, memory_mb=limits["memory_limit_mb"],
+                                  script=script)
                 execution_time = round(time.time() - start_time, 3)
-                
+
                 # Check if execution was successful
                 if result.returncode != 0:
+                    if result.usage and result.usage["memory_exceeded"]:
+                        error = f"Memory limit exceeded ({limits['memory_limit_mb']} MB)"
+                    else:
+                        error = result.stderr or "Runtime error occurred"
                     results.append({
                         "test_number": idx + 1,
                         "success": False,
-                        "error": result.stderr or "Runtime error occurred",
+                        "error": error,
                         "input": test_input,
                         "expected_output": expected_output,
                         "actual_output": None,
@@ -329,10 +552,10 @@ if __name__ == "__main__":
                     })
                 else:
                     actual_output = result.stdout.strip()
-                    
+
                     # Check if output matches expected
                     passed = actual_output.replace(" ", "") == expected_output.replace(" ", "")
-                    
+
                     results.append({
                         "test_number": idx + 1,
                         "success": True,
@@ -342,16 +565,27 @@ if __name__ == "__main__":
                         "execution_time": execution_time,
                         "passed": passed
                     })
-                    
-            except subprocess.TimeoutExpired:
+
+            except CpuTimeExceeded:
                 results.append({
                     "test_number": idx + 1,
                     "success": False,
-                    "error": "Execution timeout (5 seconds)",
+                    "error": f"Time limit exceeded ({time_limit:g} seconds of CPU time)",
                     "input": test_input,
                     "expected_output": expected_output,
                     "actual_output": None,
-                    "execution_time": 5.0,
+                    "execution_time": round(time.time() - start_time, 3),
+                    "passed": False
+                })
+            except subprocess.TimeoutExpired as e:
+                results.append({
+                    "test_number": idx + 1,
+                    "success": False,
+                    "error": f"Execution timeout ({e.timeout:g} seconds)",
+                    "input": test_input,
+                    "expected_output": expected_output,
+                    "actual_output": None,
+                    "execution_time": float(e.timeout),
                     "passed": False
                 })
             except Exception as e:
@@ -365,59 +599,66 @@ if __name__ == "__main__":
                     "execution_time": 0,
                     "passed": False
                 })
-            finally:
-                # Clean up temporary file
-                if tmp_file and os.path.exists(tmp_file):
-                    try:
-                        os.unlink(tmp_file)
-                    except:
-                        pass
-        
-        # Calculate summary
-        passed_count = sum(1 for r in results if r.get("passed", False))
-        total_count = len(results)
-        
-        return {
-            "success": True,
-            "results": results,
-            "summary": {
-                "passed": passed_count,
-                "total": total_count,
-                "percentage": round((passed_count / total_count) * 100, 1) if total_count > 0 else 0
-            }
+
+    # Calculate summary
+    passed_count = sum(1 for r in results if r.get("passed", False))
+    total_count = len(results)
+
+    return {
+        "success": True,
+        "results": results,
+        "summary": {
+            "passed": passed_count,
+            "total": total_count,
+            "percentage": round((passed_count / total_count) * 100, 1) if total_count > 0 else 0
         }
-        
+    }
+
+@app.post("/api/run")
+async def run_code_api(request: dict, http_request: Request, user: Optional[dict] = Depends(get_current_user)):
+    """Run code with multiple public test cases without grading."""
+    enforce_rate_limit(http_request, user)
+    try:
+        problem_id = request.get("problem_id")
+        code = request.get("code")
+
+        if not problem_id or not code:
+            return {"success": False, "error": "Missing problem_id or code"}
+
+        return await run_grading(_run_public_tests, problem_id, code)
+
     except Exception as e:
         return {"success": False, "error": f"Unexpected error: {str(e)}"}
 
 @app.get("/api/leaderboard")
-async def get_leaderboard_api():
-    """Get the leaderboard."""
-    if not submissions:
+def get_leaderboard_api(request: Request, problem_id: Optional[str] = None):
+    """Get the leaderboard, optionally for a single problem.
+
+    A plain ``def``: ``sync`` may read SQLite, so it runs on the threadpool.
+    """
+    leaderboard.sync()
+    if problem_id is not None and problem_id not in leaderboard.problem_ids():
         return {"leaderboard": []}
-    problems = {}
-    for entry in submissions:
-        pid = entry.get("problem_id", "unknown")
-        if pid not in problems:
-            problems[pid] = []
-        problems[pid].append(entry)
-    leaderboard = []
-    for problem_id, entries in problems.items():
-        sorted_entries = sorted(entries, key=lambda x: (-x["score"], x["timestamp"]))
-        seen_users = set()
-        for entry in sorted_entries:
-            uid = entry["user_id"]
-            if uid not in seen_users:
-                leaderboard.append({
-                    "user_id": uid,
-                    "problem_id": problem_id,
-                    "score": entry["score"],
-                    "replay_result": entry["replay_result"],
-                    "timestamp": entry["timestamp"]
-                })
-                seen_users.add(uid)
-    leaderboard.sort(key=lambda x: (-x["score"], x["timestamp"]))
-    return {"leaderboard": leaderboard}
+    return cached_json_response(
+        request, ("leaderboard", problem_id), leaderboard.version,
+        lambda: {"leaderboard": leaderboard.render(problem_id)}
+    )
+
+@app.get("/api/history")
+async def get_history_api(user_id: Optional[str] = None, problem_id: Optional[str] = None,
+                          limit: int = 50, before: Optional[str] = None):
+    """Graded attempts with per-test results, newest first; page with ``before=<next_cursor>``."""
+    if not DATABASE_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Database service unavailable.")
+    if before is not None:
+        try:
+            parse_history_cursor(before)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    result = await get_submission_history(user_id, problem_id, limit, before)
+    if not result["success"]:
+        raise HTTPException(status_code=500, detail=f"Database error: {result['error']}")
+    return {"attempts": result["attempts"], "next_cursor": result["next_cursor"]}
 
 # --- Serve Static Frontend Files ---
 # This MUST be the last route defined to act as a fallback for all non-API paths.
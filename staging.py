@@ -0,0 +1,122 @@
+"""RAM-backed staging of submission source for the subprocess backend.
+
+A grading job writes the submission once, into a directory private to this
+process under ``GRADER_STAGING_DIR`` (default ``/dev/shm``, falling back to
+the system temp directory), and every test case of the job runs that same
+file; it is removed when the job ends. The directory itself is removed at
+exit. Directories are named ``grader-<pid>-...``, so ones left behind by a
+process that was killed are swept the next time any grader process stages a
+file.
+"""
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+DIR_PREFIX = "grader-"
+
+
+def _default_root():
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+STAGING_ROOT = os.getenv("GRADER_STAGING_DIR") or _default_root()
+
+_process_dir = None
+_process_pid = None
+_lock = threading.Lock()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Alive, but owned by someone else.
+        return True
+    return True
+
+
+def sweep(root: str = None) -> int:
+    """Remove staging directories of processes that no longer exist. Returns how many."""
+    root = root or STAGING_ROOT
+    removed = 0
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return 0
+    for name in names:
+        if not name.startswith(DIR_PREFIX):
+            continue
+        try:
+            pid = int(name[len(DIR_PREFIX):].split("-", 1)[0])
+        except ValueError:
+            continue
+        if pid == os.getpid() or _pid_alive(pid):
+            continue
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+        removed += 1
+    return removed
+
+
+def _remove_process_dir():
+    if _process_dir is not None and _process_pid == os.getpid():
+        shutil.rmtree(_process_dir, ignore_errors=True)
+
+
+def _get_process_dir() -> str:
+    """This process's staging directory, created (after a sweep) on first use."""
+    global _process_dir, _process_pid
+    with _lock:
+        # A forked child must not share (or later delete) its parent's directory.
+        if _process_dir is None or _process_pid != os.getpid() or not os.path.isdir(_process_dir):
+            prefix = f"{DIR_PREFIX}{os.getpid()}-"
+            for root in (STAGING_ROOT, tempfile.gettempdir()):
+                try:
+                    removed = sweep(root)
+                    if removed:
+                        print(f"Removed {removed} stale staging directories from {root}")
+                    _process_dir = tempfile.mkdtemp(prefix=prefix, dir=root)
+                    break
+                except OSError as e:
+                    print(f"Warning: Cannot stage submissions in {root}: {e}")
+            else:
+                raise OSError("No writable directory to stage submissions in")
+            if _process_pid is None:
+                atexit.register(_remove_process_dir)
+            _process_pid = os.getpid()
+        return _process_dir
+
+
+def stage(source: str) -> str:
+    """Write ``source`` to a new file in the staging directory and return its path."""
+    fd, path = tempfile.mkstemp(suffix=".py", dir=_get_process_dir())
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(source)
+    except BaseException:
+        unstage(path)
+        raise
+    return path
+
+
+def unstage(path: str):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+@contextmanager
+def staged(source: str):
+    """Context manager: the path of ``source`` staged for the duration of the block."""
+    path = stage(source)
+    try:
+        yield path
+    finally:
+        unstage(path)
@@ -0,0 +1,286 @@
+"""Queue of submissions waiting to be graded.
+
+``POST /api/submit`` enqueues a job and returns its id straight away; grader
+threads drain the queue and store the result, which clients poll with
+``GET /api/submission/{id}``.
+
+Two backends share the same interface:
+
+* ``MemorySubmissionQueue`` keeps jobs in this process only.
+* ``SqliteSubmissionQueue`` keeps jobs in a SQLite database, so every uvicorn
+  worker on the host can enqueue, claim and look up the same jobs.
+"""
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Finished jobs are kept this long so clients can still fetch their results.
+JOB_RETENTION_SECONDS = 3600
+# Number of recently finished jobs the wait/grading time averages cover.
+METRICS_WINDOW = 200
+
+
+class SubmissionQueue(ABC):
+    """Base class: runs ``handler(payload)`` on worker threads for each job."""
+
+    def __init__(self):
+        self._threads = []
+        self._stopping = threading.Event()
+
+    def start(self, handler, workers: int):
+        for i in range(workers):
+            thread = threading.Thread(
+                target=self._work, args=(handler,), name=f"submission-queue-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout=1)
+        self._threads = []
+
+    def _work(self, handler):
+        while not self._stopping.is_set():
+            job = self._claim(timeout=0.5)
+            if job is None:
+                continue
+            job_id, payload = job
+            try:
+                result = handler(payload)
+            except Exception as e:
+                self._finish(job_id, error=str(e))
+            else:
+                self._finish(job_id, result=result)
+
+    @abstractmethod
+    def enqueue(self, payload: dict) -> str:
+        """Add a job and return its id."""
+
+    @abstractmethod
+    def get(self, job_id: str):
+        """Return the status view of a job, or None if it is unknown."""
+
+    @abstractmethod
+    def metrics(self) -> dict:
+        """Return queue depth and recent wait and grading times."""
+
+    @abstractmethod
+    def _claim(self, timeout: float):
+        """Mark the next queued job running; return ``(job_id, payload)``, or None after ``timeout``."""
+
+    @abstractmethod
+    def _finish(self, job_id: str, result=None, error=None):
+        """Store the result or error of a claimed job."""
+
+
+def _job_view(job: dict):
+    view = {
+        "submission_id": job["id"],
+        "status": job["status"],
+        "result": job["result"],
+        "error": job["error"],
+        "wait_time": None,
+        "grading_time": None,
+    }
+    if job["started_at"] is not None:
+        view["wait_time"] = round(job["started_at"] - job["enqueued_at"], 3)
+    if job["finished_at"] is not None:
+        view["grading_time"] = round(job["finished_at"] - job["started_at"], 3)
+    return view
+
+
+def _average(values):
+    values = list(values)
+    return round(sum(values) / len(values), 3) if values else None
+
+
+class MemorySubmissionQueue(SubmissionQueue):
+    def __init__(self):
+        super().__init__()
+        self._pending = queue.Queue()
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._finished = deque(maxlen=METRICS_WINDOW)
+
+    def enqueue(self, payload: dict) -> str:
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            self._prune()
+            self._jobs[job_id] = {
+                "id": job_id, "status": QUEUED, "payload": payload, "result": None, "error": None,
+                "enqueued_at": time.time(), "started_at": None, "finished_at": None,
+            }
+        self._pending.put(job_id)
+        return job_id
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return _job_view(job) if job else None
+
+    def metrics(self) -> dict:
+        with self._lock:
+            running = sum(1 for job in self._jobs.values() if job["status"] == RUNNING)
+            finished = list(self._finished)
+        return {
+            "backend": "memory",
+            "queue_depth": self._pending.qsize(),
+            "running": running,
+            "avg_wait_time": _average(wait for wait, _ in finished),
+            "avg_grading_time": _average(grading for _, grading in finished),
+        }
+
+    def _claim(self, timeout: float):
+        try:
+            job_id = self._pending.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        with self._lock:
+            job = self._jobs[job_id]
+            job["status"] = RUNNING
+            job["started_at"] = time.time()
+            return job_id, job["payload"]
+
+    def _finish(self, job_id: str, result=None, error=None):
+        with self._lock:
+            job = self._jobs[job_id]
+            job["status"] = FAILED if error is not None else DONE
+            job["result"] = result
+            job["error"] = error
+            job["finished_at"] = time.time()
+            self._finished.append((job["started_at"] - job["enqueued_at"], job["finished_at"] - job["started_at"]))
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job["finished_at"] is not None and job["finished_at"] < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+class SqliteSubmissionQueue(SubmissionQueue):
+    # A job still marked running after this long belongs to a dead worker.
+    STALE_SECONDS = 600
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        self._wakeup = threading.Condition()
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS submission_jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                enqueued_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS submission_jobs_status ON submission_jobs (status, enqueued_at)")
+        conn.execute(
+            "UPDATE submission_jobs SET status = ?, started_at = NULL WHERE status = ? AND started_at < ?",
+            (QUEUED, RUNNING, time.time() - self.STALE_SECONDS)
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, payload: dict) -> str:
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO submission_jobs (id, status, payload, enqueued_at) VALUES (?, ?, ?, ?)",
+            (job_id, QUEUED, json.dumps(payload), now)
+        )
+        conn.execute(
+            "DELETE FROM submission_jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+            (now - JOB_RETENTION_SECONDS,)
+        )
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id: str):
+        row = self._conn().execute("SELECT * FROM submission_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return _job_view(job)
+
+    def metrics(self) -> dict:
+        conn = self._conn()
+        counts = dict(conn.execute(
+            "SELECT status, COUNT(*) FROM submission_jobs WHERE status IN (?, ?) GROUP BY status",
+            (QUEUED, RUNNING)
+        ).fetchall())
+        averages = conn.execute("""
+            SELECT AVG(started_at - enqueued_at), AVG(finished_at - started_at) FROM (
+                SELECT enqueued_at, started_at, finished_at FROM submission_jobs
+                WHERE finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT ?
+            )
+        """, (METRICS_WINDOW,)).fetchone()
+        return {
+            "backend": "sqlite",
+            "queue_depth": counts.get(QUEUED, 0),
+            "running": counts.get(RUNNING, 0),
+            "avg_wait_time": round(averages[0], 3) if averages[0] is not None else None,
+            "avg_grading_time": round(averages[1], 3) if averages[1] is not None else None,
+        }
+
+    def _claim(self, timeout: float):
+        row = self._conn().execute("""
+            UPDATE submission_jobs SET status = ?, started_at = ?
+            WHERE id = (
+                SELECT id FROM submission_jobs WHERE status = ? ORDER BY enqueued_at LIMIT 1
+            )
+            RETURNING id, payload
+        """, (RUNNING, time.time(), QUEUED)).fetchone()
+        if row is None:
+            # Jobs enqueued by this process wake us up; jobs from other
+            # processes are picked up on the next poll.
+            with self._wakeup:
+                self._wakeup.wait(timeout)
+            return None
+        return row["id"], json.loads(row["payload"])
+
+    def _finish(self, job_id: str, result=None, error=None):
+        self._conn().execute(
+            "UPDATE submission_jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+            (FAILED if error is not None else DONE, json.dumps(result, default=str) if result is not None else None,
+             error, time.time(), job_id)
+        )
+
+
+def create_submission_queue(backend: str, sqlite_path: str = "submission_queue.db"):
+    """Return a queue for ``backend`` ("memory" or "sqlite")."""
+    if backend == "memory":
+        return MemorySubmissionQueue()
+    if backend == "sqlite":
+        return SqliteSubmissionQueue(os.path.abspath(sqlite_path))
+    raise ValueError(f"Unknown submission queue backend: {backend}")
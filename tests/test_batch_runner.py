@@ -0,0 +1,17 @@
+import unittest
+
+from batch_runner import run_batch
+from sandbox import CaseResult
+from test_worker_pool import RAISE_MEMORY_LIMIT
+
+
+class BatchRunnerLimitsTest(unittest.TestCase):
+    def test_case_cannot_raise_its_memory_limit(self):
+        [(outcome, _)] = run_batch(RAISE_MEMORY_LIMIT, [""], [(5, 1, 256)])
+        self.assertIsInstance(outcome, CaseResult)
+        self.assertNotEqual(outcome.returncode, 0)
+        self.assertNotIn("allocated", outcome.stdout)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from leaderboard import Leaderboard, LeaderboardLog
+
+
+def entry(user_id: str, score: int) -> dict:
+    return {
+        "submission_id": user_id, "user_id": user_id, "problem_id": "power-of-two", "score": score,
+        "replay_result": f"{score}/10 tests passed", "timestamp": f"2026-01-01T00:00:0{score}",
+        "error_details": [],
+    }
+
+
+class LeaderboardLogTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.snapshot_path = os.path.join(self.directory, "leaderboard.json")
+        with open(self.snapshot_path, "w") as f:
+            json.dump([], f)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def start(self, **kwargs):
+        """Load the log the way the server does at startup."""
+        log = LeaderboardLog(self.snapshot_path, **kwargs)
+        leaderboard = Leaderboard(log.load())
+        log.open(leaderboard.entries)
+        return log, leaderboard
+
+    def record(self, log, leaderboard, item):
+        leaderboard.submit(item)
+        log.append(item)
+
+    def test_replay_after_crash_mid_append(self):
+        log, leaderboard = self.start()
+        for i in range(2):
+            self.record(log, leaderboard, entry(f"user{i}", i))
+        with open(log.log_path, "a") as f:
+            f.write('{"submission_id": "torn", "us')
+        log, leaderboard = self.start()
+        for i in range(2, 5):
+            self.record(log, leaderboard, entry(f"user{i}", i))
+        log, _ = self.start()
+        self.assertEqual([item["user_id"] for item in log.load()], [f"user{i}" for i in range(5)])
+
+    def test_compaction_keeps_every_entry(self):
+        log, leaderboard = self.start(compact_every=1000)
+        for i in range(3):
+            self.record(log, leaderboard, entry(f"user{i}", i))
+        log.compact()
+        self.record(log, leaderboard, entry("user3", 3))
+        self.assertFalse(os.path.exists(log.rotated_path))
+        with open(self.snapshot_path) as f:
+            self.assertEqual(len(json.load(f)), 3)
+        log, _ = self.start()
+        self.assertEqual(sorted(item["user_id"] for item in log.load()), [f"user{i}" for i in range(4)])
+
+
+if __name__ == "__main__":
+    unittest.main()
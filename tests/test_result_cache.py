@@ -0,0 +1,33 @@
+import unittest
+
+from result_cache import ResultCache, normalize_code
+
+
+def key(code: str) -> str:
+    return ResultCache.key(code, "problem-hash", [None])
+
+
+class NormalizeCodeTest(unittest.TestCase):
+    def test_line_endings_and_trailing_blank_lines_share_a_key(self):
+        code = "def solve():\n    print(input())\n"
+        self.assertEqual(key(code), key(code.replace("\n", "\r\n")))
+        self.assertEqual(key(code), key(code + "\n  \n\n"))
+
+    def test_whitespace_inside_string_literal_changes_key(self):
+        code = 'def solve():\n    print("""a   \nb""")\n'
+        self.assertNotEqual(key(code), key(code.replace("a   \n", "a\n")))
+
+    def test_whitespace_after_line_continuation_changes_key(self):
+        # "\ " before a newline is a syntax error; "\" alone continues the line.
+        code = "def solve():\n    x = 1 + \\ \n        2\n    print(x)\n"
+        fixed = code.replace("\\ \n", "\\\n")
+        self.assertNotEqual(normalize_code(code), normalize_code(fixed))
+        self.assertNotEqual(key(code), key(fixed))
+
+    def test_leading_blank_lines_change_key(self):
+        code = "def solve():\n    print(1 / 0)\n"
+        self.assertNotEqual(key(code), key("\n\n" + code))
+
+
+if __name__ == "__main__":
+    unittest.main()
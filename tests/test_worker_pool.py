@@ -0,0 +1,56 @@
+import unittest
+
+from worker_pool import WorkerPool
+
+RAISE_MEMORY_LIMIT = (
+    "import resource\n"
+    "def solve():\n"
+    "    resource.setrlimit(resource.RLIMIT_AS, (resource.RLIM_INFINITY, resource.RLIM_INFINITY))\n"
+    "    x = bytearray(600 * 1024 * 1024)\n"
+    "    print('allocated')\n"
+)
+
+
+class WorkerPoolIsolationTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = WorkerPool(1)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_state_does_not_reach_the_next_job(self):
+        attacker = (
+            "import builtins, math, sys\n"
+            "def solve():\n"
+            "    main = sys.modules['__main__']\n"
+            "    main._run_job = main.run_in_process = lambda *args, **kwargs: None\n"
+            "    math.pi = 3\n"
+            "    builtins.leaked = True\n"
+            "    sys.modules['json'] = None\n"
+            "    print('done')\n"
+        )
+        self.assertEqual(self.pool.run(attacker, "", timeout=5).stdout, "done\n")
+        victim = (
+            "import builtins, json, math\n"
+            "def solve():\n"
+            "    print(input(), math.pi, hasattr(builtins, 'leaked'))\n"
+        )
+        result = self.pool.run(victim, "victim", timeout=5)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout, f"victim {3.141592653589793} False\n")
+
+    def test_job_exiting_the_process_does_not_kill_the_worker(self):
+        result = self.pool.run("import os\ndef solve():\n    os._exit(3)\n", "", timeout=5)
+        self.assertEqual(result.returncode, 3)
+        worker_pid = self.pool._idle.queue[0].process.pid
+        self.assertEqual(self.pool.run("def solve():\n    print('ok')\n", "", timeout=5).stdout, "ok\n")
+        self.assertEqual(self.pool._idle.queue[0].process.pid, worker_pid)
+
+    def test_job_cannot_raise_its_memory_limit(self):
+        result = self.pool.run(RAISE_MEMORY_LIMIT, "", timeout=5, memory_mb=256)
+        self.assertNotEqual(result.returncode, 0)
+        self.assertNotIn("allocated", result.stdout)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,239 @@
+"""Pool of pre-started, pre-imported Python workers for running submissions.
+
+Each worker is a long-lived interpreter, started as ``python worker_pool.py``
+so it never imports the server, that receives ``(code, stdin)`` over a
+socket. For every job it forks a child, which executes the code in a fresh
+``__main__`` namespace, calls ``solve()`` and writes back the return code and
+output; the worker reaps the child with ``os.wait4`` and sends the record,
+with the CPU time and peak memory the child used, to the pool. Nothing a job
+changes survives it. The child runs under hard process, memory and CPU time
+limits that the submission cannot raise, with the CPU time capped more
+precisely by a profiling timer. Workers run in their own process group, so
+killing one also kills the job it is running; they are recycled after a
+fixed number of jobs, after a timeout, or when they die.
+"""
+import json
+import os
+import queue
+import signal
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import CancelledError
+from multiprocessing.connection import Connection
+
+from sandbox import (
+    CaseResult, CpuTimeExceeded, WallTimeExceeded, install_case_timers, make_usage, run_in_process, rusage_cpu,
+    set_limits,
+)
+
+WORKER_ARGS = [sys.executable, os.path.abspath(__file__)]
+
+# Modules solutions commonly import; loading them once per worker keeps
+# them out of the per-test cost.
+PRELOAD_MODULES = (
+    "bisect", "collections", "functools", "heapq", "itertools",
+    "json", "math", "re", "string", "typing",
+)
+
+POOL_ARGS = ["<worker-pool>"]
+
+# How often a waiting job checks whether it has been cancelled.
+POLL_INTERVAL = 0.05
+
+
+def _run_job(conn, code: str, stdin_data: str, cpu_limit: float, memory_mb: int, max_processes: int):
+    """Run one job in a forked child and return its ``sandbox.run_in_process`` record."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(read_fd)
+            conn.close()
+            # Hard limits: the submission cannot raise them again.
+            set_limits(cpu_limit, memory_mb, max_processes)
+            record = run_in_process(code + "\n\nsolve()\n", stdin_data, cpu_limit=cpu_limit, memory_mb=memory_mb)
+            with os.fdopen(write_fd, "w") as out:
+                out.write(json.dumps(record))
+        finally:
+            os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd, "r") as f:
+        encoded = f.read()
+    _, status, rusage = os.wait4(pid, 0)
+    if encoded:
+        record = json.loads(encoded)
+    else:
+        # The submission ended the child itself (os._exit, a signal, ...).
+        exitcode = os.waitstatus_to_exitcode(status)
+        record = {
+            "returncode": exitcode or 1, "stdout": "", "stderr": f"Process exited unexpectedly (exit code {exitcode})",
+            "cpu_exceeded": exitcode == -signal.SIGXCPU, "memory_exceeded": False,
+        }
+    record["cpu"] = rusage_cpu(rusage)
+    record["memory_kb"] = rusage.ru_maxrss
+    if cpu_limit is not None and record["cpu"] > cpu_limit:
+        # Stopped by RLIMIT_CPU after switching off the profiling timer.
+        record["cpu_exceeded"] = True
+    return record
+
+
+def _worker_main(conn, max_processes=None):
+    install_case_timers()
+    for name in PRELOAD_MODULES:
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        conn.send(_run_job(conn, *job, max_processes))
+
+
+class _Worker:
+    def __init__(self, max_processes=None):
+        parent_sock, child_sock = socket.socketpair()
+        with parent_sock, child_sock:
+            args = WORKER_ARGS + [str(child_sock.fileno())]
+            if max_processes is not None:
+                args.append(str(max_processes))
+            self.process = subprocess.Popen(
+                args, stdin=subprocess.DEVNULL, pass_fds=(child_sock.fileno(),), start_new_session=True
+            )
+            self.conn = Connection(parent_sock.detach())
+        self.jobs = 0
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def wait(self, timeout: float):
+        """Return the worker's exit code, or None if it is still running after ``timeout``."""
+        try:
+            return self.process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            return None
+
+    def _kill(self):
+        """Kill the worker and the job it may be running."""
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def close(self, kill: bool = False):
+        try:
+            if kill:
+                self._kill()
+            else:
+                self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        if self.wait(timeout=1) is None:
+            self._kill()
+            self.process.wait()
+        self.conn.close()
+
+
+class WorkerPool:
+    """A fixed-size pool of warm workers.
+
+    ``run`` has the same contract as ``subprocess.run(..., capture_output=True,
+    text=True, timeout=...)``: it returns a ``CompletedProcess`` (a
+    ``sandbox.CaseResult`` carrying the job's usage) and raises
+    ``subprocess.TimeoutExpired`` (``sandbox.WallTimeExceeded``) when the job
+    has not finished within ``timeout`` seconds of wall time, or
+    ``sandbox.CpuTimeExceeded`` once it has used ``cpu_limit`` seconds of CPU.
+    ``memory_mb`` overrides the pool's memory limit for one job.
+    Setting the optional ``cancel`` event kills the job's worker and raises
+    ``concurrent.futures.CancelledError``.
+    """
+
+    def __init__(self, size: int, max_jobs_per_worker: int = 50, memory_mb: int = None,
+                 max_processes: int = None):
+        self.size = size
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.memory_mb = memory_mb
+        self.max_processes = max_processes
+        self._idle = queue.Queue()
+        self._closed = False
+        for _ in range(size):
+            self._idle.put(self._new_worker())
+
+    def _new_worker(self):
+        return _Worker(self.max_processes)
+
+    def _acquire(self):
+        worker = self._idle.get()
+        if not worker.is_alive():
+            worker.close(kill=True)
+            worker = self._new_worker()
+        return worker
+
+    def _release(self, worker, recycle: bool = False):
+        if recycle or worker.jobs >= self.max_jobs_per_worker:
+            worker.close(kill=recycle)
+            if self._closed:
+                return
+            worker = self._new_worker()
+        if self._closed:
+            worker.close()
+            return
+        self._idle.put(worker)
+
+    def run(self, code: str, stdin_data: str, timeout: float, cancel=None, cpu_limit: float = None,
+            memory_mb: int = None):
+        worker = self._acquire()
+        recycle = False
+        start = time.perf_counter()
+        try:
+            worker.jobs += 1
+            worker.conn.send((code, stdin_data, cpu_limit, memory_mb if memory_mb is not None else self.memory_mb))
+            deadline = time.monotonic() + timeout
+            while not worker.conn.poll(min(POLL_INTERVAL, max(0, deadline - time.monotonic()))):
+                if cancel is not None and cancel.is_set():
+                    recycle = True
+                    raise CancelledError()
+                if time.monotonic() >= deadline:
+                    recycle = True
+                    raise WallTimeExceeded(POOL_ARGS, timeout, make_usage(time.perf_counter() - start))
+            try:
+                record = worker.conn.recv()
+            except (EOFError, OSError):
+                # The worker itself died (killed from outside, out of memory, ...).
+                recycle = True
+                exitcode = worker.wait(timeout=1)
+                return CaseResult(
+                    POOL_ARGS, exitcode if exitcode not in (None, 0) else 1, "",
+                    f"Worker exited unexpectedly (exit code {exitcode})",
+                    make_usage(time.perf_counter() - start)
+                )
+            usage = make_usage(
+                time.perf_counter() - start, record["cpu"], record["memory_kb"], record["memory_exceeded"]
+            )
+            if record["cpu_exceeded"]:
+                raise CpuTimeExceeded(POOL_ARGS, cpu_limit, usage)
+            return CaseResult(POOL_ARGS, record["returncode"], record["stdout"], record["stderr"], usage)
+        except (BrokenPipeError, EOFError):
+            recycle = True
+            raise
+        finally:
+            self._release(worker, recycle=recycle)
+
+    def shutdown(self):
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.close()
+
+
+if __name__ == "__main__":
+    _worker_main(Connection(int(sys.argv[1])), int(sys.argv[2]) if len(sys.argv) > 2 else None)